@@ -0,0 +1,255 @@
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from header_lexer import tokenize
+from split_tutorial import extract_sections, save_sections
+from merge_tutorial import merge_sections
+from renumber_tutorial import build_edits, parse_document, write_edits
+
+# Words for synthetic Cyrillic (and some Latin) titles
+TITLE_WORDS = [
+    'Настройка', 'окружения', 'проекта', 'Установка', 'работа', 'с', 'промтами',
+    'Безопасность', 'модели', 'Интеграция', 'тестирование', 'Горячие', 'клавиши',
+    'Ёмкость', 'контекста', 'правила', 'ошибок', 'Решение', 'проблем', 'для',
+    'Cursor', 'IDE', 'API', 'Flutter', 'JHipster', 'Node.js', 'React', 'Agent'
+]
+
+BODY_WORDS = [
+    'Cursor', 'позволяет', 'быстро', 'создавать', 'код', 'и', 'проверять', 'его',
+    'с', 'помощью', 'ИИ', 'ассистента', 'в', 'режиме', 'Agent', 'или', 'Ask',
+    'используйте', 'контекст', 'файлов', 'через', 'символ', '@', 'ещё', 'всё'
+]
+
+# Stages in pipeline order; each one reads what the previous one wrote
+STAGES = ['split', 'merge', 'parse', 'renumber']
+
+def make_title(rng):
+    """Return a random title of two to five words."""
+    return ' '.join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(2, 5))).capitalize()
+
+def make_paragraph(rng):
+    """Return a random paragraph of body text."""
+    return ' '.join(rng.choice(BODY_WORDS) for _ in range(rng.randint(20, 60))) + '.'
+
+def generate_tutorial(sections=2000, subsections=4, subsubsections=2, paragraphs=2,
+                      anchors=True, toc=True, seed=0):
+    """Generate a synthetic tutorial in the format the scripts expect.
+
+    Produces "## N." sections with "### N.M." subsections and "#### N.M.K."
+    sub-subsections, Cyrillic titles, code fences with "#" comments, an
+    existing TOC and (optionally) anchors from a previous renumbering. Section
+    numbers are shuffled slightly so that renumbering has work to do.
+    """
+    rng = random.Random(seed)
+    outline = []
+    body = []
+    number = 0
+
+    for i in range(1, sections + 1):
+        # Occasionally skip a number, like a document after a deleted section
+        number += 2 if rng.random() < 0.05 else 1
+        title = make_title(rng)
+        outline.append(('', f'{number}. {title}', f'section-{i}'))
+        if anchors:
+            body.append(f'<a id="section-{i}"></a>')
+        body.extend([f'## {number}. {title}', ''])
+        for _ in range(paragraphs):
+            body.extend([make_paragraph(rng), ''])
+
+        for j in range(1, rng.randint(max(0, subsections - 2), subsections + 2) + 1):
+            title = make_title(rng)
+            outline.append(('    ', f'{number}.{j} {title}', f'section-{i}-{j}'))
+            if anchors:
+                body.append(f'<a id="section-{i}-{j}"></a>')
+            body.extend([f'### {number}.{j}. {title}', '', make_paragraph(rng), ''])
+            if rng.random() < 0.3:
+                body.extend(['```bash', '# установка зависимостей', 'npm install', '```', ''])
+
+            for k in range(1, rng.randint(0, subsubsections * 2) + 1):
+                title = make_title(rng)
+                outline.append(('        ', f'{number}.{j}.{k} {title}', f'section-{i}-{j}-{k}'))
+                if anchors:
+                    body.append(f'<a id="section-{i}-{j}-{k}"></a>')
+                body.extend([f'#### {number}.{j}.{k}. {title}', '', make_paragraph(rng), ''])
+
+    lines = ['# Руководство по использованию Cursor IDE', '']
+    if toc:
+        lines.extend(['# Содержание', ''])
+        lines.extend(f'{indent}- [{text}](#{anchor})' for indent, text, anchor in outline)
+        lines.append('')
+    return '\n'.join(lines + body)
+
+def write_section_groups(sections, config_file, group_size=5):
+    """Write a section_groups.json that groups section files in runs of group_size."""
+    numbers = list(range(1, sections + 1))
+    groups = {}
+    for start in range(0, len(numbers), group_size):
+        name = f'group_{start // group_size + 1:04d}'
+        groups[name] = {
+            'header': f'# Группа {start // group_size + 1}\n\nСинтетическая группа разделов.\n\n',
+            'sections': numbers[start:start + group_size]
+        }
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(groups, f, ensure_ascii=False)
+    return groups
+
+def run_stage(stage, workspace):
+    """Run one pipeline stage end to end (including file I/O) inside workspace.
+
+    Returns the number of bytes the stage read.
+    """
+    source = os.path.join(workspace, 'tutorial.md')
+    sections_dir = os.path.join(workspace, 'sections')
+    merged = os.path.join(workspace, 'merged.md')
+    renumbered = os.path.join(workspace, 'renumbered.md')
+
+    if stage == 'split':
+        with open(source, 'r', encoding='utf-8') as f:
+            content = f.read()
+        save_sections(extract_sections(content), sections_dir)
+        return len(content.encode('utf-8'))
+
+    if stage == 'merge':
+        with open(os.path.join(workspace, 'section_groups.json'), 'r', encoding='utf-8') as f:
+            section_groups = json.load(f)
+        merge_sections(sections_dir, merged, section_groups)
+        return os.path.getsize(merged)
+
+    # parse and renumber both work on the original tutorial
+    with open(source, 'r', encoding='utf-8') as f:
+        content = f.read()
+    doc_info = parse_document(content)
+    if stage == 'renumber':
+        with open(renumbered, 'w', encoding='utf-8') as f:
+            write_edits(doc_info['lines'], build_edits(doc_info), f)
+    return len(content.encode('utf-8'))
+
+def measure(stage, workspace, headers, repeat=3):
+    """Time a stage (best of repeat runs) and measure its peak traced memory."""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start_time = time.perf_counter()
+        size = run_stage(stage, workspace)
+        timings.append(time.perf_counter() - start_time)
+
+    # Peak memory comes from a separate run since tracing slows things down
+    gc.collect()
+    tracemalloc.start()
+    run_stage(stage, workspace)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = min(timings)
+    return {
+        'seconds': seconds,
+        'bytes': size,
+        'mb_per_second': size / seconds / 1e6,
+        'headers_per_second': headers / seconds,
+        'peak_bytes': peak
+    }
+
+def compare_with_baseline(results, baseline, threshold):
+    """Return a list of (stage, metric, old, new) regressions beyond threshold."""
+    regressions = []
+    for stage, result in results.items():
+        old = baseline.get('results', {}).get(stage)
+        if not old:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if old[metric] and result[metric] > old[metric] * (1 + threshold):
+                regressions.append((stage, metric, old[metric], result[metric]))
+    return regressions
+
+def print_report(results, baseline=None):
+    """Print a table of stage timings, throughput and memory."""
+    print(f"\n{'stage':<10} {'time ms':>10} {'MB/s':>8} {'headers/s':>12} {'peak MiB':>9} {'vs base':>8}")
+    for stage, result in results.items():
+        change = ''
+        old = (baseline or {}).get('results', {}).get(stage)
+        if old and old['seconds']:
+            change = f"{(result['seconds'] / old['seconds'] - 1) * 100:+.0f}%"
+        print(f"{stage:<10} {result['seconds'] * 1000:>10.1f} {result['mb_per_second']:>8.1f} "
+              f"{result['headers_per_second']:>12.0f} {result['peak_bytes'] / 2**20:>9.1f} {change:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark split, merge, parse and renumber on a synthetic tutorial.')
+    parser.add_argument('--sections', type=int, default=2000, help='Number of sections (default: 2000)')
+    parser.add_argument('--subsections', type=int, default=4, help='Average subsections per section (default: 4)')
+    parser.add_argument('--subsubsections', type=int, default=2,
+                        help='Average sub-subsections per subsection (default: 2)')
+    parser.add_argument('--paragraphs', type=int, default=2, help='Paragraphs per section (default: 2)')
+    parser.add_argument('--no-anchors', action='store_true', help='Do not include anchors from a previous run')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage, best is reported (default: 3)')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma-separated stages to run (default: all)')
+    parser.add_argument('--generate', metavar='FILE', help='Only write the synthetic tutorial to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against a stored baseline')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Store the results as a baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown or memory growth counted as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    params = {
+        'sections': args.sections,
+        'subsections': args.subsections,
+        'subsubsections': args.subsubsections,
+        'paragraphs': args.paragraphs,
+        'anchors': not args.no_anchors,
+        'seed': args.seed
+    }
+    content = generate_tutorial(args.sections, args.subsections, args.subsubsections, args.paragraphs,
+                                anchors=not args.no_anchors, seed=args.seed)
+    if args.generate:
+        with open(args.generate, 'w', encoding='utf-8') as f:
+            f.write(content)
+        print(f"Wrote synthetic tutorial to {args.generate} ({len(content.encode('utf-8')) / 1e6:.1f} MB)")
+        return
+
+    headers = len(tokenize(content))
+    print(f"Synthetic tutorial: {len(content.encode('utf-8')) / 1e6:.1f} MB, {headers} headers")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workspace:
+        with open(os.path.join(workspace, 'tutorial.md'), 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.makedirs(os.path.join(workspace, 'sections'))
+        write_section_groups(args.sections, os.path.join(workspace, 'section_groups.json'))
+        del content
+
+        stages = args.stages.split(',')
+        for stage in STAGES:
+            if stage in stages or (stage == 'split' and 'merge' in stages):
+                # merge needs the section files written by split
+                results[stage] = measure(stage, workspace, headers, args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print("Warning: baseline was recorded with different generator parameters")
+
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if baseline:
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        for stage, metric, old, new in regressions:
+            print(f"REGRESSION {stage} {metric}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_NAME = '.build_manifest.json'
+
+def content_hash(text):
+    """Return the SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def combined_hash(*parts):
+    """Return a single digest for an ordered list of digests and strings."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def config_hash(entry):
+    """Return a digest of a JSON configuration entry."""
+    return content_hash(json.dumps(entry, sort_keys=True, ensure_ascii=False))
+
+class BuildManifest:
+    """Content hashes of generated outputs, persisted between runs.
+
+    An output is rewritten only when the hash of what would be written
+    differs from the recorded one (or the file is missing). Digests of input
+    files are cached by (size, mtime) so unchanged inputs are not re-read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.outputs = {}
+        self.files = {}
+        self.written = 0
+        self.skipped = 0
+        # Outputs may be written from a thread pool
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.outputs = data.get('outputs', {})
+            self.files = data.get('files', {})
+
+    @classmethod
+    def for_directory(cls, directory):
+        """Open the manifest stored in a directory."""
+        return cls(os.path.join(directory or '.', MANIFEST_NAME))
+
+    def is_current(self, output_path, digest):
+        """Check whether output_path exists and was built from digest."""
+        key = os.path.normpath(output_path)
+        return self.outputs.get(key) == digest and os.path.exists(output_path)
+
+    def record(self, output_path, digest):
+        """Remember that output_path was built from digest."""
+        with self.lock:
+            self.outputs[os.path.normpath(output_path)] = digest
+            self.written += 1
+
+    def skip(self):
+        """Count an output that was left untouched."""
+        with self.lock:
+            self.skipped += 1
+
+    def write_if_changed(self, output_path, content, digest=None):
+        """Write content unless the recorded digest matches; return True if written.
+
+        digest defaults to the hash of content but may be any key describing
+        the inputs the content was generated from.
+        """
+        content_digest = content_hash(content)
+        if digest is None:
+            digest = content_digest
+        if self.is_current(output_path, digest):
+            self.skip()
+            return False
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.record(output_path, digest)
+        self.record_file(output_path, content_digest)
+        return True
+
+    def file_digest(self, path):
+        """Return the content digest of a file, reusing the cached one if it is unchanged."""
+        key = os.path.normpath(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        cached = self.files.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            digest = content_hash(f.read())
+        with self.lock:
+            self.files[key] = [signature, digest]
+        return digest
+
+    def record_file(self, path, digest):
+        """Cache the content digest of a file that was just written."""
+        stat = os.stat(path)
+        with self.lock:
+            self.files[os.path.normpath(path)] = [[stat.st_size, stat.st_mtime_ns], digest]
+
+    def save(self):
+        """Write the manifest back to disk."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'outputs': self.outputs, 'files': self.files}, f,
+                      ensure_ascii=False, indent=2, sort_keys=True)
@@ -0,0 +1,297 @@
+import os
+import re
+import time
+import argparse
+
+from build_manifest import content_hash
+from instrumentation import add_instrumentation_arguments, instrumented
+from split_tutorial import ensure_dir, extract_sections, renumber_section_content, section_filename, write_section_group
+from merge_tutorial import TOC_TITLE, SectionStore, load_section_groups, toc_group_lines
+from renderers import FORMATS
+from renumber_tutorial import ANCHOR_PATTERNS, default_output_file
+from slugs import ANCHOR_STYLES
+from tutorial_pipeline import MergedDocument, build_tutorial_file, write_renumbered
+
+# Section files written by split_tutorial ("section_07.md")
+SECTION_FILE_PATTERN = re.compile(r'section_(\d+)\.md$')
+
+class TutorialBuilder:
+    """Split, merge and renumber the tutorial, keeping the parsed model in memory.
+
+    build() runs every stage once. poll() compares file stats with the last
+    run and re-runs only what the change affects: an edited source is
+    re-split, an edited section file invalidates just that section, and the
+    TOC entries and merged lines are rebuilt only for groups whose inputs
+    changed, keyed by the content hashes of their sections. The merged
+    tutorial keeps the header tokens of its sections, so renumbering it
+    does not lex it again.
+
+    With in_memory only the renumbered tutorial is written, straight from
+    the source (see tutorial_pipeline.build_tutorial_file), plus the
+    intermediate files in debug_dir; section files are not read or written.
+    max_depth, formats and anchor_style are as in renumber_tutorial.
+    """
+
+    def __init__(self, source_file='cursor_tutorial.md', sections_dir='split_tutorial',
+                 config_file='section_groups.json', merged_file='cursor_tutorial_merged.md',
+                 renumbered_file=None, in_memory=False, debug_dir=None, max_depth=None, formats=None,
+                 anchor_style='number'):
+        self.source_file = source_file
+        self.sections_dir = sections_dir
+        self.config_file = config_file
+        self.merged_file = merged_file
+        self.renumbered_file = renumbered_file or default_output_file(merged_file)
+        self.in_memory = in_memory
+        self.debug_dir = debug_dir
+        self.max_depth = max_depth
+        self.formats = formats
+        self.anchor_style = anchor_style
+
+        self.sections = {}
+        self.section_texts = {}
+        self.section_groups = {}
+        self.store = SectionStore(sections_dir)
+        self.section_hashes = {}
+        self.toc_cache = {}
+        self.group_cache = {}
+        self.stats = {}
+        self.merged = None
+        self.document = None
+
+    def stat(self, path):
+        """Return the (mtime, size) signature of a file, or None if it is missing."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def snapshot(self):
+        """Return the stat signatures of the source, configuration and section files."""
+        stats = {
+            self.source_file: self.stat(self.source_file),
+            self.config_file: self.stat(self.config_file)
+        }
+        if not self.in_memory and os.path.isdir(self.sections_dir):
+            with os.scandir(self.sections_dir) as entries:
+                for entry in entries:
+                    if SECTION_FILE_PATTERN.match(entry.name):
+                        stat = entry.stat()
+                        stats[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    def write_file(self, path, content, watched=False):
+        """Write a generated file.
+
+        The stats of watched files are updated right away so that our own
+        writes do not trigger another rebuild.
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        if watched:
+            self.stats[path] = self.stat(path)
+
+    def split_source(self, changed_groups=()):
+        """Re-split the source and rewrite only the section and group files that changed."""
+        with open(self.source_file, 'r', encoding='utf-8') as f:
+            self.sections = extract_sections(f.read())
+        ensure_dir(self.sections_dir)
+
+        changed_originals = set()
+        for new_num, old_num in enumerate(sorted(self.sections.keys()), 1):
+            content = renumber_section_content(self.sections[old_num], new_num)
+            if self.section_texts.get(new_num) == content:
+                continue
+            self.section_texts[new_num] = content
+            self.write_file(os.path.join(self.sections_dir, section_filename(new_num)), content, watched=True)
+            self.store.put(new_num, content)
+            self.section_hashes.pop(new_num, None)
+            changed_originals.add(old_num)
+            print(f"Updated section file: {section_filename(new_num)} (original section {old_num})")
+
+        # Group files only depend on their own members and configuration entry
+        for group_name, group_info in self.section_groups.items():
+            if group_name in changed_groups or changed_originals & set(group_info.get('sections', [])):
+                write_section_group(self.sections, group_name, group_info, self.sections_dir)
+
+    def section_hash(self, section_num):
+        """Return the content hash of a section, or None if its file is missing."""
+        if section_num not in self.section_hashes:
+            section = self.store.get(section_num)
+            self.section_hashes[section_num] = content_hash(section.content) if section else None
+        return self.section_hashes[section_num]
+
+    def merge(self):
+        """Rebuild the merged tutorial from cached per-group TOC lines and merged groups.
+
+        Returns True if the merged content changed.
+        """
+        toc = [TOC_TITLE]
+        toc_number = 1
+
+        for group_name, group_info in self.section_groups.items():
+            members = tuple(group_info.get('sections', []))
+
+            # TOC entries only change with the captions and their numbering
+            captions = tuple(section.caption if section else None
+                             for section in map(self.store.get, members))
+            toc_key = (group_info['header'], toc_number, members, captions)
+            cached = self.toc_cache.get(group_name)
+            if cached is None or cached[0] != toc_key:
+                cached = (toc_key, toc_group_lines(group_info, self.store, toc_number))
+                self.toc_cache[group_name] = cached
+            toc.extend(cached[1])
+            toc_number += len(members)
+
+        # Sections keep their header tokens, so only renumbered headers are lexed again
+        document = MergedDocument()
+        document.add_text('\n'.join(toc))
+        current_section = 1
+        for group_name, group_info in self.section_groups.items():
+            # A group only changes with its header, its first number or its sections
+            group_key = (group_info['header'], current_section,
+                         tuple((num, self.section_hash(num)) for num in group_info.get('sections', [])))
+            cached = self.group_cache.get(group_name)
+            if cached is None or cached[0] != group_key:
+                piece = MergedDocument()
+                next_section = piece.add_group(group_info, self.store, current_section)
+                cached = (group_key, piece, next_section)
+                self.group_cache[group_name] = cached
+            document.add_document(cached[1])
+            current_section = cached[2]
+
+        merged = '\n'.join(document.lines)
+        if merged == self.merged:
+            return False
+        # Anchors left in section files are removed by a full parse
+        if ANCHOR_PATTERNS[self.anchor_style].search(merged):
+            document.exact = False
+        self.merged = merged
+        self.document = document
+        self.write_file(self.merged_file, merged)
+        return True
+
+    def renumber(self):
+        """Renumber the merged tutorial held in memory."""
+        doc_info = self.document.document(self.anchor_style)
+        write_renumbered(doc_info, self.renumbered_file, self.max_depth, self.formats, self.anchor_style)
+
+    def build_in_memory(self):
+        """Write the renumbered tutorial straight from the source."""
+        summary = build_tutorial_file(self.source_file, self.section_groups, self.renumbered_file, self.debug_dir,
+                                      self.max_depth, self.formats, self.anchor_style)
+        print(f"Built {', '.join(summary['outputs'])} from {self.source_file}")
+        print(f"Found {summary['sections']} sections, {summary['subsections']} subsections, "
+              f"and {summary['subsubsections']} sub-subsections")
+
+    def build(self):
+        """Run every stage from scratch."""
+        self.stats = self.snapshot()
+        self.section_groups = load_section_groups(self.config_file) or {}
+        if self.in_memory:
+            self.build_in_memory()
+            return
+        if os.path.exists(self.source_file):
+            self.split_source(changed_groups=set(self.section_groups))
+        self.merge()
+        self.renumber()
+        print(f"Built {self.merged_file} and {self.renumbered_file}")
+
+    def poll(self):
+        """Rebuild whatever depends on files changed since the last check.
+
+        Returns True if anything was rebuilt.
+        """
+        start_time = time.perf_counter()
+        current = self.snapshot()
+        changed = [path for path in current.keys() | self.stats.keys()
+                   if current.get(path) != self.stats.get(path)]
+        self.stats = current
+        if not changed:
+            return False
+
+        changed_groups = set()
+        if self.config_file in changed:
+            old_groups = self.section_groups
+            self.section_groups = load_section_groups(self.config_file) or {}
+            changed_groups = {name for name, info in self.section_groups.items()
+                              if old_groups.get(name) != info}
+
+        if self.in_memory:
+            self.build_in_memory()
+            elapsed = (time.perf_counter() - start_time) * 1000
+            print(f"Rebuilt after changes to {', '.join(sorted(changed))} in {elapsed:.1f} ms")
+            return True
+
+        for path in changed:
+            match = SECTION_FILE_PATTERN.match(os.path.basename(path))
+            if match and path not in (self.source_file, self.config_file):
+                # Edited by hand: reload just this section on next access
+                section_num = int(match.group(1))
+                self.store.invalidate(section_num)
+                self.section_texts.pop(section_num, None)
+                self.section_hashes.pop(section_num, None)
+
+        if self.source_file in changed and os.path.exists(self.source_file):
+            self.split_source(changed_groups)
+        elif changed_groups and self.sections:
+            for group_name in changed_groups:
+                write_section_group(self.sections, group_name, self.section_groups[group_name], self.sections_dir)
+
+        if self.merge():
+            self.renumber()
+        elapsed = (time.perf_counter() - start_time) * 1000
+        print(f"Rebuilt after changes to {', '.join(sorted(changed))} in {elapsed:.1f} ms")
+        return True
+
+    def watch(self, interval=0.5):
+        """Poll for changes until interrupted."""
+        print(f"Watching {self.source_file}, {self.config_file} and {self.sections_dir} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(interval)
+                self.poll()
+        except KeyboardInterrupt:
+            print("Stopped watching")
+
+def main():
+    parser = argparse.ArgumentParser(description='Split, merge and renumber the tutorial in one run.')
+    parser.add_argument('--source', default='cursor_tutorial.md',
+                        help='Source tutorial to split (default: cursor_tutorial.md)')
+    parser.add_argument('--sections-dir', default='split_tutorial',
+                        help='Directory for section files (default: split_tutorial)')
+    parser.add_argument('--config', default='section_groups.json',
+                        help='Section grouping configuration (default: section_groups.json)')
+    parser.add_argument('--output', '-o', default='cursor_tutorial_merged.md',
+                        help='Merged tutorial (default: cursor_tutorial_merged.md)')
+    parser.add_argument('--renumbered', help='Renumbered tutorial (default: output with _renumbered suffix)')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='Split, merge and renumber in memory, writing only the renumbered tutorial')
+    parser.add_argument('--debug-dir',
+                        help='With --in-memory, also write the section files and the merged tutorial to this directory')
+    parser.add_argument('--format', '-f', action='append', choices=FORMATS, dest='formats',
+                        help='Format of the renumbered tutorial; repeat to write several: markdown (default), html or json')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='Renumber, anchor and list in the TOC only headers down to this depth (default: all)')
+    parser.add_argument('--anchors', choices=ANCHOR_STYLES, default='number',
+                        help='Header anchors: number (section-4-2, the default) or slug (transliterated title)')
+    parser.add_argument('--watch', '-w', action='store_true',
+                        help='Keep running and rebuild affected outputs when inputs change')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='Polling interval in seconds for --watch (default: 0.5)')
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    if args.debug_dir and not args.in_memory:
+        parser.error('--debug-dir only applies to --in-memory builds')
+    if args.max_depth is not None and args.max_depth < 1:
+        parser.error('--max-depth must be at least 1')
+
+    builder = TutorialBuilder(args.source, args.sections_dir, args.config, args.output, args.renumbered,
+                              args.in_memory, args.debug_dir, args.max_depth, args.formats, args.anchors)
+    with instrumented(args, 'build_tutorial'):
+        builder.build()
+    if args.watch:
+        builder.watch(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import re
+import sys
+import argparse
+from urllib.parse import unquote
+
+from cross_references import INLINE_CODE_PATTERN
+from header_lexer import HeaderLexer, is_toc_header
+from renumber_tutorial import expand_inputs
+
+# Explicit anchors such as the ones renumber_tutorial inserts
+ANCHOR_PATTERN = re.compile(r'<a\s+(?:id|name)="([^"]+)"')
+
+# Markdown links and images: [text](target "title")
+LINK_PATTERN = re.compile(r'\[([^\]]*)\]\(<?([^)\s>]+)>?(?:\s+"[^"]*")?\)')
+
+# HTML links
+HREF_PATTERN = re.compile(r'href="([^"]+)"')
+
+# Links with a scheme (https:, mailto:) are not checked
+EXTERNAL_PATTERN = re.compile(r'[a-zA-Z][a-zA-Z0-9+.-]*:')
+
+# Leading number of a TOC entry ("3.2 " or "3. ")
+TOC_NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)*\s*\.?\s+')
+
+MARKDOWN_EXTENSIONS = ('.md', '.markdown')
+
+def github_slug(text):
+    """Return the anchor GitHub generates for a header text."""
+    text = re.sub(r'[^\w\- ]', '', text.strip().lower())
+    return text.replace(' ', '-')
+
+def in_spans(position, spans):
+    """Check whether position falls inside one of the (start, end) spans."""
+    return any(start <= position < end for start, end in spans)
+
+def scan_file(path):
+    """Collect the anchors and links of a Markdown file in one pass.
+
+    Returns a dict with anchors (ID -> line number), titles (ID -> title of
+    the header the anchor belongs to), duplicates [(line, ID)] and links
+    [(line, target, text, in_toc)]. Header anchors follow GitHub, including
+    the -1, -2 suffixes for repeated headers. Code fences and inline code
+    are skipped.
+    """
+    anchors = {}
+    titles = {}
+    duplicates = []
+    links = []
+    slug_counts = {}
+    pending = []
+    in_toc = False
+    lexer = HeaderLexer()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            token = lexer.feed(line)
+            if token is not None:
+                slug = github_slug(line[token.level:])
+                count = slug_counts.get(slug, 0)
+                slug_counts[slug] = count + 1
+                if count:
+                    slug = f'{slug}-{count}'
+                anchors.setdefault(slug, number)
+                titles[slug] = token.title
+                # Explicit anchors right before a header belong to it
+                for anchor in pending:
+                    titles[anchor] = token.title
+                pending = []
+
+                # The TOC runs until the next header that is not a TOC group header
+                if is_toc_header(token):
+                    in_toc = True
+                elif in_toc and token.spaced and token.level != 3:
+                    in_toc = False
+                continue
+
+            if lexer.fence is not None or line[:3] in ('```', '~~~'):
+                continue
+            # Matches starting inside inline code are examples, not links
+            code_spans = [match.span() for match in INLINE_CODE_PATTERN.finditer(line)] if '`' in line else ()
+
+            if '<a' in line:
+                for match in ANCHOR_PATTERN.finditer(line):
+                    if in_spans(match.start(), code_spans):
+                        continue
+                    anchor = match.group(1)
+                    if anchor in anchors:
+                        duplicates.append((number, anchor))
+                    else:
+                        anchors[anchor] = number
+                    pending.append(anchor)
+            if '](' in line:
+                for match in LINK_PATTERN.finditer(line):
+                    if not in_spans(match.start(), code_spans):
+                        links.append((number, match.group(2), match.group(1), in_toc))
+            if 'href=' in line:
+                for match in HREF_PATTERN.finditer(line):
+                    if not in_spans(match.start(), code_spans):
+                        links.append((number, match.group(1), '', in_toc))
+
+    return {'anchors': anchors, 'titles': titles, 'duplicates': duplicates, 'links': links}
+
+class LinkChecker:
+    """Resolve links against the anchors of every file, scanning each file once."""
+
+    def __init__(self):
+        self.scans = {}
+        self.exists = {}
+
+    def scan(self, path):
+        """Return the scan of a file, reading it on first use."""
+        scan = self.scans.get(path)
+        if scan is None:
+            scan = self.scans[path] = scan_file(path)
+        return scan
+
+    def path_exists(self, path):
+        exists = self.exists.get(path)
+        if exists is None:
+            exists = self.exists[path] = os.path.exists(path)
+        return exists
+
+    def check_file(self, path):
+        """Return the problems of one file as (line, kind, message) tuples."""
+        scan = self.scan(path)
+        problems = [(line, 'duplicate-anchor', f'anchor "{anchor}" is defined more than once')
+                    for line, anchor in scan['duplicates']]
+
+        for line, target, text, in_toc in scan['links']:
+            if EXTERNAL_PATTERN.match(target):
+                continue
+            file_part, _, fragment = target.partition('#')
+            fragment = unquote(fragment)
+            if file_part:
+                target_path = os.path.normpath(os.path.join(os.path.dirname(path), unquote(file_part)))
+                if not self.path_exists(target_path):
+                    problems.append((line, 'missing-file', f'{target} points to a missing file'))
+                    continue
+            else:
+                target_path = path
+            if not fragment or not target_path.endswith(MARKDOWN_EXTENSIONS):
+                continue
+
+            target_scan = self.scan(target_path)
+            if fragment not in target_scan['anchors']:
+                kind = 'orphaned-toc-entry' if in_toc else 'dangling-link'
+                problems.append((line, kind, f'{target} has no matching anchor'))
+            elif in_toc and text:
+                # A TOC entry should carry the title of the header it points to
+                title = target_scan['titles'].get(fragment)
+                entry = TOC_NUMBER_PATTERN.sub('', text, count=1)
+                if title is not None and entry != title:
+                    problems.append((line, 'toc-mismatch', f'TOC entry "{text}" points to "{title}"'))
+
+        problems.sort()
+        return problems
+
+def main():
+    parser = argparse.ArgumentParser(description='Check anchors, intra-document links and cross-file links in Markdown files.')
+    parser.add_argument('inputs', nargs='*', default=['.'], metavar='path',
+                        help='Markdown files, directories (searched recursively, skipping _renumbered outputs) or glob patterns (default: .)')
+    args = parser.parse_args()
+
+    # Normalized like the link targets, so each file is scanned once
+    files = list(dict.fromkeys(os.path.normpath(path) for path in expand_inputs(args.inputs)))
+    checker = LinkChecker()
+    total = 0
+    for path in files:
+        for line, kind, message in checker.check_file(path):
+            print(f"{path}:{line}: {kind}: {message}")
+            total += 1
+
+    links = sum(len(scan['links']) for scan in checker.scans.values())
+    print(f"\nChecked {links} links in {len(checker.scans)} files: {total} problems")
+    sys.exit(1 if total else 0)
+
+if __name__ == "__main__":
+    main()
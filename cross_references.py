@@ -0,0 +1,82 @@
+import re
+
+# Every reference form in one compiled alternation, so a line is scanned
+# once no matter how many sections the map holds:
+#   links to an anchor:  [text](#section-4-2), href="#section-4-2"
+#   numbers in the text: "см. раздел 5.2", "в разделе 5", "section 3.1"
+REFERENCE_PATTERN = re.compile(
+    r'(?<=[(\'"])#section-(?P<anchor>\d+(?:-\d+)*)(?![-\w])'
+    r'|(?<!\w)(?:(?:под)?раздел\w*|sections?)[ \t\u00a0]+'
+    r'(?P<number>\d+(?:\.\d+)*)(?!\.?\d)',
+    re.I)
+
+# Inline code spans are examples, not references
+INLINE_CODE_PATTERN = re.compile(r'`[^`]*`')
+
+class ReferenceRewriter:
+    """Rewrite references to numbered headers from old to new numbers.
+
+    numbers maps an old number path (a tuple of ints) to its new path, or
+    to None when the old number is ambiguous. With by_section only the
+    leading component is looked up, which fits a merge that moves whole
+    sections: a map {(5,): (2,)} turns "5.3" into "2.3". References that
+    cannot be resolved are left as written and collected in unresolved as
+    (source, line, reference, reason) tuples.
+    """
+
+    def __init__(self, numbers, by_section=False):
+        self.numbers = numbers
+        self.by_section = by_section
+        self.unresolved = []
+        self.rewritten = 0
+
+    def resolve(self, numbers):
+        """Return the new number path for an old one, None if ambiguous; raises KeyError if unknown."""
+        if not self.by_section:
+            return self.numbers[numbers]
+        section = self.numbers[numbers[:1]]
+        return None if section is None else section + numbers[1:]
+
+    def rewrite(self, line, line_number=None, source=None):
+        """Return line with its references renumbered (the same object if nothing changed)."""
+        code_spans = [match.span() for match in INLINE_CODE_PATTERN.finditer(line)] if '`' in line else ()
+        parts = []
+        position = 0
+        for match in REFERENCE_PATTERN.finditer(line):
+            if any(start <= match.start() < end for start, end in code_spans):
+                continue
+            anchor = match.group('anchor')
+            text = anchor if anchor is not None else match.group('number')
+            old = tuple(int(n) for n in text.split('-' if anchor is not None else '.'))
+            try:
+                new = self.resolve(old)
+            except KeyError:
+                self.unresolved.append((source, line_number, match.group(), 'no such section'))
+                continue
+            if new is None:
+                self.unresolved.append((source, line_number, match.group(), 'ambiguous section number'))
+                continue
+            if new == old:
+                continue
+
+            if anchor is not None:
+                start, end = match.span('anchor')
+                replacement = '-'.join(str(n) for n in new)
+            else:
+                start, end = match.span('number')
+                replacement = '.'.join(str(n) for n in new)
+            parts.append(line[position:start])
+            parts.append(replacement)
+            position = end
+            self.rewritten += 1
+
+        if not parts:
+            return line
+        parts.append(line[position:])
+        return ''.join(parts)
+
+def print_unresolved(unresolved):
+    """Print references that could not be resolved, one per line."""
+    for source, line_number, reference, reason in unresolved:
+        location = f"{source}:{line_number}" if source else f"Line {line_number}"
+        print(f"{location}: unresolved reference '{reference}' ({reason})")
@@ -0,0 +1,91 @@
+import os
+import pickle
+import hashlib
+import tempfile
+
+from instrumentation import METRICS
+
+# Bump whenever parse_document's output changes so old entries stop matching
+MODEL_VERSION = 6
+
+CACHE_DIR = '.renumber_cache'
+
+class DocumentCache:
+    """On-disk cache of parsed documents keyed by content hash and model version.
+
+    Each entry is a pickle file named after its key. Hits touch the file, so
+    file mtimes order entries by last use, and storing a new entry evicts the
+    least recently used ones once the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=64 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, content, anchor_style='number'):
+        """Return the cache key of a document's raw content parsed for anchor_style."""
+        digest = hashlib.sha256(f'model-{MODEL_VERSION}\0{anchor_style}\0'.encode('utf-8'))
+        digest.update(content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        """Return the cached entry for key, or None."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            METRICS.count('cache_misses')
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # A damaged or outdated entry is just a miss
+            METRICS.count('cache_misses')
+            return None
+        METRICS.count('cache_hits')
+        return entry
+
+    def put(self, key, entry):
+        """Store an entry, then evict old entries beyond the size limit."""
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first; other processes may read the key meanwhile
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.pickle'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            total -= size
+            METRICS.count('cache_evictions')
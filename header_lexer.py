@@ -0,0 +1,293 @@
+import re
+from collections import namedtuple
+
+from instrumentation import METRICS
+
+# One compiled pattern classifies a header line in a single attempt:
+# hashes, optional spacing, optional number path ("4", "4.3", "4.3.1"),
+# optional trailing dot and the remaining title text.
+HEADER_PATTERN = re.compile(r'(#+)([ \t]*)(?:(\d+(?:\.\d+)*)(\.?)(?=\s|$))?\s*(.*?)\s*$')
+
+# Opening/closing line of a fenced code block (``` or ~~~, up to 3 spaces indent)
+FENCE_PATTERN = re.compile(r' {0,3}(`{3,}|~{3,})(.*)$')
+
+# Candidate lines for iter_headers_bytes: headers and code fences
+BYTES_LINE_PATTERN = re.compile(rb'^(?:#|[ ]{0,3}(?:```|~~~))[^\n]*', re.M)
+
+TOC_TITLES = ('Содержание', 'Оглавление')
+
+
+class HeaderToken(namedtuple('HeaderToken', [
+        'index', 'offset', 'level', 'numbers', 'line',
+        'spaced', 'trailing_dot', 'number_span', 'title_span'])):
+    """A Markdown header line classified by the lexer.
+
+    index is the line number (0-based), offset the character offset of the
+    line start, level the number of hashes and numbers the parsed number
+    path as a tuple of ints (empty for unnumbered headers). The title is
+    sliced from line on access.
+    """
+    __slots__ = ()
+
+    @property
+    def title(self):
+        """Header text after the number path, without surrounding whitespace."""
+        start, end = self.title_span
+        return self.line[start:end]
+
+    @property
+    def depth(self):
+        """Depth of the number path (1 for "N.", 2 for "N.M" and so on)."""
+        return len(self.numbers)
+
+    def with_numbers(self, numbers):
+        """Return the header line with its number path replaced."""
+        start, end = self.number_span
+        return self.line[:start] + '.'.join(str(n) for n in numbers) + self.line[end:]
+
+
+def lex_line(line, index=0, offset=0):
+    """Classify a single line, returning a HeaderToken or None.
+
+    This does not know about code fences; use HeaderLexer for that.
+    """
+    if line[:1] != '#':
+        return None
+    if line.endswith('\n'):
+        line = line[:-1]
+    match = HEADER_PATTERN.match(line)
+    hashes, spacing, number_text, dot = match.group(1, 2, 3, 4)
+    if not spacing and number_text is None:
+        # "#hashtag" or a bare "###" is not a header
+        return None
+    if number_text is None:
+        numbers = ()
+        number_span = (match.end(2), match.end(2))
+    else:
+        numbers = tuple(int(n) for n in number_text.split('.'))
+        number_span = match.span(3)
+    return HeaderToken(index, offset, len(hashes), numbers, line,
+                       bool(spacing), bool(dot), number_span, match.span(5))
+
+
+class HeaderLexer:
+    """Classify Markdown lines one at a time in a single forward pass.
+
+    Tracks fenced code blocks so that lines such as "# install deps" inside a
+    shell snippet are never reported as headers.
+    """
+
+    def __init__(self):
+        self.index = 0
+        self.offset = 0
+        self.fence = None
+
+    def feed(self, line):
+        """Consume the next line and return its HeaderToken, or None."""
+        index = self.index
+        offset = self.offset
+        self.index += 1
+        # Lines from str.split('\n') have lost their terminator
+        self.offset += len(line) if line.endswith('\n') else len(line) + 1
+
+        first = line[:1]
+        if first in ('`', '~', ' '):
+            self.track_fence(line)
+            return None
+        if self.fence is not None or first != '#':
+            return None
+        return lex_line(line, index, offset)
+
+    def track_fence(self, line):
+        """Open or close a fenced code block if line is a fence marker."""
+        fence = FENCE_PATTERN.match(line)
+        if fence:
+            METRICS.match('fence')
+            marker = fence.group(1)
+            if self.fence is None:
+                self.fence = marker
+            elif (marker[0] == self.fence[0] and len(marker) >= len(self.fence)
+                    and not fence.group(2).strip()):
+                self.fence = None
+
+    @property
+    def in_fence(self):
+        """True while inside a fenced code block."""
+        return self.fence is not None
+
+
+class HeaderRanges:
+    """Decide where the ranges of numbered headers stop.
+
+    A numbered header runs up to the next header of any kind whose Markdown
+    level is the same or higher, so an unnumbered "# Group" header ends the
+    section before it. A numbered header also ends the open headers at its
+    own outline depth or deeper. Items are whatever the caller tracks.
+    """
+
+    def __init__(self):
+        self.stack = []
+
+    def end(self, level, depth=None):
+        """Pop and return the items a header ends, innermost first."""
+        ended = []
+        while self.stack:
+            top_level, top_depth, item = self.stack[-1]
+            if top_level < level and (depth is None or top_depth < depth):
+                break
+            ended.append(item)
+            self.stack.pop()
+        return ended
+
+    def push(self, item, level, depth):
+        """Open the range of a numbered header."""
+        self.stack.append((level, depth, item))
+
+    def top(self):
+        """Return the innermost open item, or None."""
+        return self.stack[-1][2] if self.stack else None
+
+    def close(self):
+        """Pop and return every open item at the end of the document."""
+        return self.end(0)
+
+
+def iter_headers(lines):
+    """Yield a HeaderToken for every header line outside code fences."""
+    lexer = HeaderLexer()
+    feed = lexer.feed
+    headers = 0
+    for line in lines:
+        token = feed(line)
+        if token is not None:
+            headers += 1
+            yield token
+    METRICS.count('lines_scanned', lexer.index)
+    METRICS.match('header', headers)
+
+
+def count_newlines(buffer, start, end, chunk_size=1 << 20):
+    """Count b'\\n' in buffer[start:end] without copying more than chunk_size at once."""
+    count = 0
+    while start < end:
+        stop = min(start + chunk_size, end)
+        count += buffer[start:stop].count(b'\n')
+        start = stop
+    return count
+
+
+def iter_headers_bytes(buffer):
+    """Yield (token, end) for every header line of a bytes-like buffer.
+
+    Works directly on bytes or an mmap: a single regex scan finds the lines
+    that start with '#' or a code fence, and only those lines are decoded.
+    Token offsets and end positions are byte offsets; index is the line number.
+    """
+    lexer = HeaderLexer()
+    line_index = 0
+    last = 0
+    headers = 0
+    for match in BYTES_LINE_PATTERN.finditer(buffer):
+        start, end = match.span()
+        line_index += count_newlines(buffer, last, start)
+        last = start
+        line = match.group().decode('utf-8')
+        if line[:1] != '#':
+            lexer.track_fence(line)
+            continue
+        if lexer.fence is not None:
+            continue
+        token = lex_line(line, line_index, start)
+        if token is not None:
+            headers += 1
+            yield token, end
+    METRICS.count('lines_scanned', line_index + count_newlines(buffer, last, len(buffer)) + 1)
+    METRICS.match('header', headers)
+
+
+def scan_shard(buffer, start, end):
+    """Scan the byte range [start, end) of a buffer for header and fence lines.
+
+    start and end must be line boundaries. Fences are not tracked here,
+    since a shard cannot know whether it starts inside a code block.
+    Returns (items, newlines): items holds (token, end) for every header
+    line and the decoded text of every fence line, in order, with token
+    indexes counted from the shard start; newlines is the number of
+    newlines in the range.
+    """
+    items = []
+    line_index = 0
+    last = start
+    for match in BYTES_LINE_PATTERN.finditer(buffer, start, end):
+        line_start, line_end = match.span()
+        line_index += count_newlines(buffer, last, line_start)
+        last = line_start
+        line = match.group().decode('utf-8')
+        if line[:1] != '#':
+            items.append(line)
+            continue
+        token = lex_line(line, line_index, line_start)
+        if token is not None:
+            items.append((token, line_end))
+    return items, line_index + count_newlines(buffer, last, end)
+
+
+def iter_shard_headers(shards):
+    """Yield (token, end) like iter_headers_bytes from the scan_shard results of consecutive shards.
+
+    Line indexes become global through a running sum of the newline counts
+    of the shards before, and the code fence state is carried from one
+    shard into the next.
+    """
+    lexer = HeaderLexer()
+    base = 0
+    headers = 0
+    for items, newlines in shards:
+        for item in items:
+            if isinstance(item, str):
+                lexer.track_fence(item)
+            elif lexer.fence is None:
+                token, end = item
+                headers += 1
+                yield token._replace(index=base + token.index), end
+        base += newlines
+    METRICS.count('lines_scanned', base + 1)
+    METRICS.match('header', headers)
+
+
+def tokenize_lines(lines):
+    """Return the list of header tokens found in a list of lines."""
+    return list(iter_headers(lines))
+
+
+def tokenize(content):
+    """Return the list of header tokens found in content."""
+    return tokenize_lines(content.split('\n'))
+
+
+def is_section_header(token):
+    """Check for a main section header: "# N. Title" or "## N. Title"."""
+    return (token.level <= 2 and token.spaced and token.trailing_dot
+            and len(token.numbers) == 1)
+
+
+def is_toc_header(token):
+    """Check for a table of contents header ("# Содержание")."""
+    return token.spaced and not token.numbers and token.title.startswith(TOC_TITLES)
+
+
+def renumber_header(token, new_number):
+    """Return the header line moved under section new_number, or None.
+
+    Main section headers ("## 4. Title") get their number replaced and deeper
+    headers ("### 4.2 Title", "#### 4.2.1 Title") get their leading section
+    component replaced. Other headers are left alone.
+    """
+    if not token.spaced or not token.numbers:
+        return None
+    if token.level <= 2:
+        if not token.trailing_dot and len(token.numbers) == 1:
+            return None
+    elif len(token.numbers) < 2:
+        return None
+    return token.with_numbers((new_number,) + token.numbers[1:])
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import cProfile
+from collections import defaultdict
+from contextlib import contextmanager
+
+class Metrics:
+    """Per-stage timings and I/O counters shared by the tutorial scripts.
+
+    Collection is off by default; every recording method returns at once
+    unless enable() was called, so instrumented code costs next to nothing
+    in normal runs.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far and disable collection."""
+        self.enabled = False
+        self.stages = defaultdict(lambda: {'seconds': 0.0, 'calls': 0})
+        self.counters = defaultdict(int)
+        self.matches = defaultdict(int)
+        self.files_read = {}
+        self.files_written = {}
+
+    def enable(self):
+        """Start collecting."""
+        self.enabled = True
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work as the named stage."""
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages[name]
+            stage['seconds'] += time.perf_counter() - start_time
+            stage['calls'] += 1
+
+    def count(self, name, amount=1):
+        """Add to a named counter (e.g. lines_scanned)."""
+        if self.enabled:
+            self.counters[name] += amount
+
+    def match(self, pattern, amount=1):
+        """Add to the match count of a named pattern."""
+        if self.enabled:
+            self.matches[pattern] += amount
+
+    def read(self, path):
+        """Record a file that was read, taking its size from the file system."""
+        if self.enabled:
+            size = os.path.getsize(path)
+            self.files_read[path] = size
+            self.counters['bytes_read'] += size
+
+    def wrote(self, path):
+        """Record a file that was written, taking its size from the file system."""
+        if self.enabled:
+            size = os.path.getsize(path)
+            self.files_written[path] = size
+            self.counters['bytes_written'] += size
+
+    def report(self):
+        """Return everything recorded as a JSON-serializable dict."""
+        return {
+            'stages': dict(self.stages),
+            'counters': dict(self.counters),
+            'matches': dict(self.matches),
+            'files': {
+                'read': sorted(self.files_read),
+                'written': sorted(self.files_written)
+            }
+        }
+
+    def merge(self, report):
+        """Add a report produced elsewhere (e.g. in a worker process)."""
+        for name, stage in report['stages'].items():
+            self.stages[name]['seconds'] += stage['seconds']
+            self.stages[name]['calls'] += stage['calls']
+        for name, amount in report['counters'].items():
+            self.counters[name] += amount
+        for name, amount in report['matches'].items():
+            self.matches[name] += amount
+        for path in report['files']['read']:
+            self.files_read.setdefault(path, 0)
+        for path in report['files']['written']:
+            self.files_written.setdefault(path, 0)
+
+    def write_json(self, path, tool):
+        """Write the report to a JSON file."""
+        report = self.report()
+        report['tool'] = tool
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+# Shared by all scripts in a process
+METRICS = Metrics()
+
+def add_instrumentation_arguments(parser):
+    """Add --metrics-json and --profile to a script's argument parser."""
+    parser.add_argument('--metrics-json', metavar='FILE',
+                        help='Write per-stage timings, I/O and match counters to FILE as JSON')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write a cProfile dump of the run to FILE (main process only)')
+
+@contextmanager
+def instrumented(args, tool):
+    """Collect metrics and/or a profile around a script run, as requested in args."""
+    if args.metrics_json:
+        METRICS.enable()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with METRICS.stage('total'):
+            yield METRICS
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.metrics_json:
+            METRICS.write_json(args.metrics_json, tool)
@@ -1,6 +1,15 @@
 import os
 import json
-import re
+import argparse
+
+from build_manifest import BuildManifest, combined_hash, config_hash
+from cross_references import ReferenceRewriter, print_unresolved
+from instrumentation import METRICS, add_instrumentation_arguments, instrumented
+from header_lexer import HeaderLexer, is_section_header, iter_headers, renumber_header
+from renumber_tutorial import anchor_id, build_outline, iter_numbered_headers
+from slugs import ANCHOR_STYLES, SlugRegistry, slugify
+
+TOC_TITLE = "# Руководство по использованию Cursor IDE\n\n## Содержание\n"
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
@@ -13,126 +22,448 @@ def load_section_groups(config_file='section_groups.json'):
             return json.load(f)
     return None
 
+def section_file_path(section_num, input_dir):
+    """Return the path of a section file in the input directory."""
+    return os.path.join(input_dir, f'section_{str(section_num).zfill(2)}.md')
+
 def read_section_file(section_num, input_dir):
     """Read a section file from the input directory."""
     filename = f'section_{str(section_num).zfill(2)}.md'
-    filepath = os.path.join(input_dir, filename)
+    filepath = section_file_path(section_num, input_dir)
     
     if not os.path.exists(filepath):
         print(f"Warning: Section file {filename} not found")
         return None
         
     with open(filepath, 'r', encoding='utf-8') as f:
-        return f.read()
+        content = f.read()
+    METRICS.read(filepath)
+    return content
 
 def extract_section_caption(content):
     """Extract the section caption from the content."""
     if not content:
         return None
     
-    # Try to find the first header line
-    lines = content.split('\n')
-    for line in lines:
-        # Match any level header with a number (e.g., "# 1. Some Caption" or "## 15. Some Caption")
-        match = re.match(r'^#{1,2}\s+\d+\.\s+(.+)$', line)
-        if match:
-            return match.group(1)
+    # Find the first numbered header (e.g., "# 1. Some Caption" or "## 15. Some Caption")
+    for token in iter_headers(content.split('\n')):
+        if is_section_header(token) and token.title:
+            return token.title
+    return None
+
+def read_section_caption(filepath):
+    """Read a section file only up to its first section header and return its caption."""
+    lexer = HeaderLexer()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            token = lexer.feed(line)
+            if token is not None and is_section_header(token) and token.title:
+                return token.title
     return None
 
+def copy_renumbered_section(filepath, out, new_number, separator, rewriter=None):
+    """Stream a section file to out renumbered as section new_number.
+    
+    Lines go straight from the input buffer to out; only header lines are
+    rewritten, plus references in the text if a ReferenceRewriter is given.
+    separator is written before the first line, and nothing at all is
+    written for an empty file. Returns True if the section was written.
+    """
+    lexer = HeaderLexer()
+    written = False
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not written:
+                out.write(separator)
+                written = True
+            token = lexer.feed(line)
+            if token is not None:
+                new_line = renumber_header(token, new_number)
+                if new_line is not None:
+                    line = new_line + '\n' if line.endswith('\n') else new_line
+            elif rewriter is not None and lexer.fence is None:
+                line = rewriter.rewrite(line, line_number, filepath)
+            out.write(line)
+    METRICS.read(filepath)
+    return written
+
+def renumber_section_lines(lines, tokens, new_number):
+    """Renumber already tokenized section lines, returning the new content."""
+    lines = list(lines)
+    
+    # Replace the section number in "## N." headers and the leading
+    # component of subsection headers like "### N.M"
+    for token in tokens:
+        new_line = renumber_header(token, new_number)
+        if new_line is not None:
+            lines[token.index] = new_line
+    
+    return '\n'.join(lines)
+
 def renumber_section_content(content, new_number):
     """Renumber a section's content with a new section number."""
-    # Pattern to match section headers (both ## N. and # N.)
-    section_pattern = r'^(#{1,2})\s+\d+\.'
-    
     lines = content.split('\n')
-    new_lines = []
-    
-    for line in lines:
-        # Check if this is a section header
-        match = re.match(section_pattern, line)
-        if match:
-            # Replace the old number with the new one
-            hashes = match.group(1)
-            new_line = re.sub(r'^#{1,2}\s+\d+\.', f'{hashes} {new_number}.', line)
-            new_lines.append(new_line)
+    return renumber_section_lines(lines, iter_headers(lines), new_number)
+
+def rewrite_section_references(content, rewriter, source=None):
+    """Renumber references in a section's text, leaving headers and code blocks alone."""
+    lines = content.split('\n')
+    lexer = HeaderLexer()
+    for i, line in enumerate(lines):
+        if lexer.feed(line) is None and lexer.fence is None:
+            lines[i] = rewriter.rewrite(line, i + 1, source)
+    return '\n'.join(lines)
+
+class Section:
+    """A section file loaded and tokenized once.
+    
+    content may also be a list of lines, and tokens the header tokens of
+    those lines (indexes relative to the first line) when the caller has
+    already lexed them. balanced is False if the section ends inside a
+    code fence, which would hide the headers that follow it in a merge.
+    """
+    __slots__ = ('number', 'lines', 'tokens', 'balanced', 'caption', 'renderings')
+    
+    def __init__(self, number, content, tokens=None):
+        self.number = number
+        self.lines = content.split('\n') if isinstance(content, str) else content
+        self.balanced = True
+        if tokens is None:
+            lexer = HeaderLexer()
+            tokens = [token for token in map(lexer.feed, self.lines) if token is not None]
+            self.balanced = lexer.fence is None
+            METRICS.count('lines_scanned', lexer.index)
+            METRICS.match('header', len(tokens))
+        self.tokens = tokens
+        self.caption = None
+        self.renderings = {}
+        for token in self.tokens:
+            if is_section_header(token) and token.title:
+                self.caption = token.title
+                break
+    
+    @property
+    def content(self):
+        return '\n'.join(self.lines)
+    
+    def renumbered(self, new_number):
+        """Return the section content renumbered as section new_number.
+        
+        Renderings are memoized, so a section that gets the same number in
+        several groups or editions is renumbered once.
+        """
+        content = self.renderings.get(new_number)
+        if content is None:
+            content = self.renderings[new_number] = renumber_section_lines(self.lines, self.tokens, new_number)
+        return content
+
+class SectionStore:
+    """Read and parse each section file at most once per run.
+    
+    Shared by TOC generation and body assembly; sections listed in several
+    groups are served from memory after the first read. With stream, files
+    are not kept: captions are read from the head of each file and bodies
+    copied from disk on every use, so memory does not grow with the
+    tutorial but a file is read once per use.
+    """
+    
+    def __init__(self, input_dir, stream=False):
+        self.input_dir = input_dir
+        self.stream = stream
+        self.sections = {}
+        self.captions = {}
+    
+    def get(self, section_num):
+        """Return the Section for a number, or None if its file is missing."""
+        if section_num not in self.sections:
+            content = read_section_file(section_num, self.input_dir)
+            self.put(section_num, content)
+        return self.sections[section_num]
+    
+    def put(self, section_num, content):
+        """Store section content or a Section that is already in memory (None for a missing file)."""
+        if content is not None and not isinstance(content, Section):
+            content = Section(section_num, content)
+        self.sections[section_num] = content
+    
+    def caption(self, section_num):
+        """Return the caption of a section; when streaming, files that are not loaded are read only up to it."""
+        if not self.stream or section_num in self.sections:
+            section = self.get(section_num)
+            return section.caption if section else None
+        if section_num not in self.captions:
+            filepath = section_file_path(section_num, self.input_dir)
+            if not os.path.exists(filepath):
+                print(f"Warning: Section file {os.path.basename(filepath)} not found")
+                # Remember the missing file like get() does
+                self.sections[section_num] = None
+                return None
+            self.captions[section_num] = read_section_caption(filepath)
+        return self.captions[section_num]
+    
+    def has_content(self, section_num):
+        """Check that a section exists and is not empty; when streaming, files that are not loaded are not read."""
+        if not self.stream or section_num in self.sections:
+            section = self.get(section_num)
+            return bool(section and section.content)
+        filepath = section_file_path(section_num, self.input_dir)
+        return os.path.exists(filepath) and os.path.getsize(filepath) > 0
+    
+    def numbered_titles(self, section_num):
+        """Return (number path, title) for the numbered headers of a section as renumber_tutorial outlines them.
+        
+        When streaming, files that are not loaded are lexed line by line.
+        """
+        if not self.stream or section_num in self.sections:
+            section = self.get(section_num)
+            tokens = section.tokens if section else []
         else:
-            # Also update any subsection references like "### 1.1" to match new number
-            subsection_match = re.match(r'^(#{3,})\s+\d+\.(\d+)', line)
-            if subsection_match:
-                hashes = subsection_match.group(1)
-                subsection = subsection_match.group(2)
-                new_line = re.sub(r'^#{3,}\s+\d+\.\d+', f'{hashes} {new_number}.{subsection}', line)
-                new_lines.append(new_line)
-            else:
-                new_lines.append(line)
-    
-    return '\n'.join(new_lines)
-
-def create_table_of_contents(section_groups, input_dir):
-    """Create a table of contents based on the section groups."""
-    toc = ["# Руководство по использованию Cursor IDE\n\n## Содержание\n"]
-    current_section = 1
+            filepath = section_file_path(section_num, self.input_dir)
+            if not os.path.exists(filepath):
+                return []
+            lexer = HeaderLexer()
+            with open(filepath, 'r', encoding='utf-8') as f:
+                tokens = [token for token in map(lexer.feed, f) if token is not None]
+            METRICS.read(filepath)
+        outline = build_outline(tokens)
+        return [(path, header.title) for header, path in iter_numbered_headers(outline['sections'])]
     
-    for group_name, group_info in section_groups.items():
-        # Add group header
-        group_header = group_info['header'].split('\n')[0].replace('# ', '')
-        toc.append(f"\n### {group_header}")
+    def copy_renumbered(self, section_num, out, new_number, separator, rewriter=None):
+        """Write a section renumbered as new_number to out, preceded by separator.
         
-        # Add sections in this group to TOC
-        for old_section_num in group_info.get('sections', []):
-            # Read section content to get its caption
-            section_content = read_section_file(old_section_num, input_dir)
-            caption = extract_section_caption(section_content)
-            
-            if caption:
-                toc.append(f"- [{current_section}. {caption}](#section-{current_section})")
-            else:
-                toc.append(f"- [{current_section}. Раздел {old_section_num}](#section-{current_section})")
-            current_section += 1
+        Sections are loaded once and written from memory; when streaming,
+        sections that are not loaded are copied from their file instead.
+        Returns False for a missing or empty section.
+        """
+        if not self.stream or section_num in self.sections:
+            section = self.get(section_num)
+            if not section or not section.content:
+                return False
+            content = section.renumbered(new_number)
+            if rewriter is not None:
+                content = rewrite_section_references(content, rewriter, f'section {section_num}')
+            out.write(separator)
+            out.write(content)
+            return True
+        filepath = section_file_path(section_num, self.input_dir)
+        if not os.path.exists(filepath):
+            return False
+        return copy_renumbered_section(filepath, out, new_number, separator, rewriter)
     
-    return '\n'.join(toc)
+    def invalidate(self, section_num):
+        """Forget a section so that the next get() reads its file again."""
+        self.sections.pop(section_num, None)
+        self.captions.pop(section_num, None)
+
+def toc_group_lines(group_info, store, first_number, registry=None):
+    """Return the TOC lines for one group, numbering its sections from first_number.
+    
+    With a SlugRegistry the entries link to slug anchors instead of the
+    numbered anchors. Every numbered header of a section is registered, like
+    renumber_tutorial.header_anchors does, so duplicate titles get the same
+    suffixes in both.
+    """
+    # Add group header
+    group_header = group_info['header'].split('\n')[0].replace('# ', '')
+    toc = [f"\n### {group_header}"]
+    
+    # Add sections in this group to TOC
+    for current_section, old_section_num in enumerate(group_info.get('sections', []), first_number):
+        # Get the section caption from the store
+        caption = store.caption(old_section_num)
+        anchor = f"section-{current_section}"
+        if registry is not None:
+            slugs = [registry.unique(slugify(title) or anchor_id((current_section,) + path[1:]))
+                     for path, title in store.numbered_titles(old_section_num)]
+            if slugs:
+                anchor = slugs[0]
+        
+        if caption:
+            toc.append(f"- [{current_section}. {caption}](#{anchor})")
+        else:
+            toc.append(f"- [{current_section}. Раздел {old_section_num}](#{anchor})")
+    
+    return toc
 
-def merge_sections(input_dir, output_file, section_groups):
-    """Merge sections according to configuration and create a single file."""
-    # Start with table of contents
-    content = [create_table_of_contents(section_groups, input_dir)]
+def create_table_of_contents(section_groups, input_dir, store=None, anchors='number'):
+    """Create a table of contents based on the section groups, linking to 'number' or 'slug' anchors."""
+    if store is None:
+        store = SectionStore(input_dir)
+    toc = [TOC_TITLE]
     current_section = 1
+    registry = SlugRegistry() if anchors == 'slug' else None
     
-    # Add each group and its sections
     for group_name, group_info in section_groups.items():
-        # Add group header
-        content.append(f"\n\n{group_info['header']}")
-        
-        # Add sections in this group
+        toc.extend(toc_group_lines(group_info, store, current_section, registry))
+        current_section += len(group_info.get('sections', []))
+    
+    return '\n'.join(toc)
+
+def write_group(out, group_info, store, first_number, rewriter=None):
+    """Stream one group to out and return the number of its next section.
+    
+    Sections are renumbered from first_number and missing or empty files
+    are skipped, without holding more than one line of a section file in
+    memory. A ReferenceRewriter
+    also renumbers references in the text.
+    """
+    # Add group header
+    out.write(f"\n\n\n{group_info['header']}")
+    current_section = first_number
+    
+    # Add sections in this group; missing and empty files are skipped
+    for old_section_num in group_info.get('sections', []):
+        if store.copy_renumbered(old_section_num, out, current_section, '\n', rewriter):
+            current_section += 1
+    
+    # Add separator between groups
+    out.write("\n\n---\n")
+    return current_section
+
+def merge_number_map(section_groups, store):
+    """Map the number of every merged section to its number in the merged tutorial.
+    
+    Numbers follow the body: missing and empty sections get none, and a
+    section listed more than once is ambiguous (None).
+    """
+    numbers = {}
+    current_section = 1
+    for group_info in section_groups.values():
         for old_section_num in group_info.get('sections', []):
-            section_content = read_section_file(old_section_num, input_dir)
-            if section_content:
-                # Renumber the section
-                numbered_content = renumber_section_content(section_content, current_section)
-                content.append(numbered_content)
+            if store.has_content(old_section_num):
+                key = (old_section_num,)
+                numbers[key] = None if key in numbers else (current_section,)
                 current_section += 1
-        
-        # Add separator between groups
-        content.append("\n---\n")
+    return numbers
+
+def merge_inputs_hash(input_dir, section_groups, manifest, rewrite_refs=False, anchors='number'):
+    """Digest of everything a merge reads: the configuration and each section file."""
+    parts = [config_hash(section_groups)]
+    if rewrite_refs:
+        # Rewritten references change the output for the same inputs
+        parts.append('rewrite-refs')
+    if anchors != 'number':
+        parts.append(f'anchors-{anchors}')
+    for group_info in section_groups.values():
+        for old_section_num in group_info.get('sections', []):
+            filepath = section_file_path(old_section_num, input_dir)
+            parts.append(manifest.file_digest(filepath) if os.path.exists(filepath) else '')
+    return combined_hash(*parts)
+
+def merge_sections(input_dir, output_file, section_groups, manifest=None, store=None, rewrite_refs=False,
+                   anchors='number', stream=False):
+    """Merge sections according to configuration and create a single file.
+    
+    The options match the command line flags. Returns True if the output file was written.
+    """
+    if manifest is not None:
+        inputs_key = merge_inputs_hash(input_dir, section_groups, manifest, rewrite_refs, anchors)
+        if manifest.is_current(output_file, inputs_key):
+            manifest.skip()
+            return False
+    
+    if store is None:
+        store = SectionStore(input_dir, stream)
     
-    # Write the merged content
+    rewriter = None
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(content))
+        # Start with table of contents
+        with METRICS.stage('table_of_contents'):
+            f.write(create_table_of_contents(section_groups, input_dir, store, anchors))
+        current_section = 1
+        if rewrite_refs:
+            rewriter = ReferenceRewriter(merge_number_map(section_groups, store), by_section=True)
+        
+        # Stream each group and its sections
+        with METRICS.stage('merge_groups'):
+            for group_name, group_info in section_groups.items():
+                current_section = write_group(f, group_info, store, current_section, rewriter)
+    METRICS.wrote(output_file)
+    
+    if rewriter is not None:
+        print(f"Rewrote {rewriter.rewritten} references in {output_file}")
+        print_unresolved(rewriter.unresolved)
+    
+    if manifest is not None:
+        manifest.record(output_file, inputs_key)
+    return True
 
 def main():
-    input_dir = 'split_tutorial'
-    output_file = 'cursor_tutorial_merged.md'
-    
-    # Load section groups configuration
-    section_groups = load_section_groups()
-    if not section_groups:
-        print("Error: Could not load section groups configuration")
-        return
-    
-    # Merge sections and create the output file
-    merge_sections(input_dir, output_file, section_groups)
-    print(f"Successfully merged sections into {output_file}")
-    print("Sections have been renumbered according to their order in the configuration")
+    parser = argparse.ArgumentParser(description='Merge section files into a single tutorial according to section groups.')
+    parser.add_argument('--input-dir', default='split_tutorial',
+                        help='Directory with section files (default: split_tutorial)')
+    parser.add_argument('--output', '-o', action='append',
+                        help='Path to the merged output file (default: cursor_tutorial_merged.md); '
+                             'repeat once per --config to name each edition')
+    parser.add_argument('--config', action='append',
+                        help='Section grouping configuration (default: section_groups.json); '
+                             'repeat to merge several editions from the same sections in one run')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Skip the merge when no section file or configuration changed')
+    parser.add_argument('--rewrite-refs', action='store_true',
+                        help='Renumber references such as "раздел 5.2" and (#section-5-2) along with their sections')
+    parser.add_argument('--stream', action='store_true',
+                        help='Copy section files into the output instead of loading them (bounded memory, '
+                             'but each file is read once per use)')
+    parser.add_argument('--anchors', choices=ANCHOR_STYLES, default='number',
+                        help='Link the TOC to number anchors (section-5, the default) or to slugs of the section titles')
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    
+    args.config = args.config or ['section_groups.json']
+    if args.output is None:
+        if len(args.config) == 1:
+            args.output = ['cursor_tutorial_merged.md']
+        else:
+            # One edition per configuration, named after it
+            args.output = [edition_output_file(config_file) for config_file in args.config]
+    elif len(args.output) != len(args.config):
+        parser.error('give one --output per --config')
+    
+    with instrumented(args, 'merge_tutorial'):
+        run(args)
+
+def edition_output_file(config_file):
+    """Return the merged file name of an edition: section_groups_frontend.json -> cursor_tutorial_merged_section_groups_frontend.md."""
+    name = os.path.splitext(os.path.basename(config_file))[0]
+    return f'cursor_tutorial_merged_{name}.md'
+
+def run(args):
+    """Merge the section files as configured by the parsed command line arguments."""
+    input_dir = args.input_dir
+    
+    # Load every section groups configuration before merging anything
+    editions = []
+    for config_file, output_file in zip(args.config, args.output):
+        section_groups = load_section_groups(config_file)
+        if not section_groups:
+            print(f"Error: Could not load section groups configuration {config_file}")
+            return
+        editions.append((output_file, section_groups))
+    
+    # All editions share one store, so each section file is read once
+    store = SectionStore(input_dir, args.stream)
+    
+    # Content hashes from the previous run, one manifest per output directory
+    manifests = {}
+    
+    for output_file, section_groups in editions:
+        manifest = None
+        if args.incremental:
+            directory = os.path.dirname(output_file)
+            if directory not in manifests:
+                manifests[directory] = BuildManifest.for_directory(directory)
+            manifest = manifests[directory]
+        
+        # Merge sections and create the output file
+        if merge_sections(input_dir, output_file, section_groups, manifest, store, args.rewrite_refs, args.anchors):
+            print(f"Successfully merged sections into {output_file}")
+            print("Sections have been renumbered according to their order in the configuration")
+        else:
+            print(f"{output_file} is up to date")
+    
+    for manifest in manifests.values():
+        manifest.save()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
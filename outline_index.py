@@ -0,0 +1,260 @@
+import os
+import sys
+import mmap
+import sqlite3
+import argparse
+
+from header_lexer import HeaderRanges, iter_headers_bytes
+from renumber_tutorial import ANCHOR_BYTES_PATTERNS, anchor_id, build_outline, iter_numbered_headers, slugify
+
+# Bump whenever the schema or the meaning of the stored ranges changes
+INDEX_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE headers (
+    position TEXT PRIMARY KEY,
+    number TEXT,
+    anchor TEXT,
+    slug TEXT,
+    depth INTEGER,
+    level INTEGER,
+    title TEXT,
+    start INTEGER,
+    body_end INTEGER,
+    end INTEGER,
+    parent TEXT
+);
+CREATE INDEX headers_number ON headers (number);
+CREATE INDEX headers_anchor ON headers (anchor);
+CREATE INDEX headers_slug ON headers (slug);
+CREATE INDEX headers_start ON headers (start);
+"""
+
+COLUMNS = ['position', 'number', 'anchor', 'slug', 'depth', 'level', 'title',
+           'start', 'body_end', 'end', 'parent']
+
+def default_index_file(source):
+    """Return the index file stored next to a document."""
+    return source + '.outline.db'
+
+def source_signature(source):
+    """Return the (size, mtime) signature the index was built from."""
+    stat = os.stat(source)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+def scan_outline(buffer):
+    """Return a row dict for every numbered header of a bytes-like buffer.
+
+    position is the header's place in the outline ("3.2"), which is also its
+    number after renumbering; number is the number path written in the
+    document. start..end covers the header and everything up to the next
+    header of any kind with the same or a higher Markdown level (see
+    HeaderRanges), start..body_end the part before its first child. An anchor left by renumber_tutorial belongs to the
+    header right after it.
+    """
+    # Anchor start by the offset of the header it precedes, in either anchor style
+    anchor_starts = {match.end(): match.start() for match in ANCHOR_BYTES_PATTERNS['slug'].finditer(buffer)}
+    tokens = [token for token, end in iter_headers_bytes(buffer)]
+    outline = build_outline(tokens)
+    numbered = {header.offset: (header, path) for header, path in iter_numbered_headers(outline['sections'])}
+
+    rows = []
+    ranges = HeaderRanges()
+    for token in tokens:
+        if token.offset not in numbered:
+            for row in ranges.end(token.level):
+                row['end'] = token.offset
+            continue
+
+        header, path = numbered[token.offset]
+        start = anchor_starts.get(header.offset, header.offset)
+        for row in ranges.end(header.level, len(path)):
+            row['end'] = start
+        parent = ranges.top()
+        if parent is not None and parent['body_end'] is None:
+            parent['body_end'] = start
+
+        row = {
+            'position': '.'.join(str(n) for n in path),
+            'number': '.'.join(str(n) for n in header.numbers),
+            'anchor': anchor_id(path),
+            'slug': slugify(header.title),
+            'depth': len(path),
+            'level': header.level,
+            'title': header.title,
+            'start': start,
+            'body_end': None,
+            'end': None,
+            'parent': parent['position'] if parent else None
+        }
+        rows.append(row)
+        ranges.push(row, header.level, len(path))
+
+    for row in ranges.close():
+        row['end'] = len(buffer)
+    for row in rows:
+        if row['body_end'] is None:
+            row['body_end'] = row['end']
+    return rows
+
+class OutlineIndex:
+    """A persisted outline of a Markdown document with byte ranges per header.
+
+    Lookups go to SQLite and the section text is read with a single seek, so
+    nothing is parsed after the index has been built.
+    """
+
+    def __init__(self, source, index_file=None):
+        self.source = source
+        self.index_file = index_file or default_index_file(source)
+        self.connection = sqlite3.connect(self.index_file)
+        self.connection.row_factory = sqlite3.Row
+
+    @classmethod
+    def build(cls, source, index_file=None):
+        """Scan source once and write a fresh index."""
+        index_file = index_file or default_index_file(source)
+        temp_file = index_file + '.tmp'
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+        signature = source_signature(source)
+        with open(source, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files cannot be memory-mapped
+                rows = []
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    rows = scan_outline(mm)
+
+        connection = sqlite3.connect(temp_file)
+        with connection:
+            connection.executescript(SCHEMA)
+            connection.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('version', str(INDEX_VERSION)),
+                ('source', os.path.abspath(source)),
+                ('signature', signature)
+            ])
+            connection.executemany(
+                f"INSERT INTO headers VALUES ({', '.join('?' * len(COLUMNS))})",
+                ([row[column] for column in COLUMNS] for row in rows))
+        connection.close()
+        os.replace(temp_file, index_file)
+        return cls(source, index_file)
+
+    @classmethod
+    def open(cls, source, index_file=None):
+        """Open the index of source, rebuilding it if it is missing or stale."""
+        index_file = index_file or default_index_file(source)
+        if os.path.exists(index_file):
+            index = cls(source, index_file)
+            if index.is_current():
+                return index
+            index.close()
+        return cls.build(source, index_file)
+
+    def close(self):
+        self.connection.close()
+
+    def meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def is_current(self):
+        """Check that the index matches the current source file and version."""
+        try:
+            return (self.meta('version') == str(INDEX_VERSION)
+                    and self.meta('signature') == source_signature(self.source))
+        except sqlite3.DatabaseError:
+            return False
+
+    def find(self, key):
+        """Return the header row for a position, written number, anchor or slug, or None.
+
+        Positions win over written numbers so that "3.2" means the same
+        header as in the renumbered document.
+        """
+        for column in ('position', 'number', 'anchor', 'slug'):
+            row = self.connection.execute(
+                f'SELECT * FROM headers WHERE {column} = ? ORDER BY start LIMIT 1', (key,)).fetchone()
+            if row is not None:
+                return row
+        return None
+
+    def outline(self, max_depth=None):
+        """Return all header rows in document order, optionally down to max_depth."""
+        if max_depth is None:
+            return self.connection.execute('SELECT * FROM headers ORDER BY start').fetchall()
+        return self.connection.execute(
+            'SELECT * FROM headers WHERE depth <= ? ORDER BY start', (max_depth,)).fetchall()
+
+    def subtree(self, row):
+        """Return the rows of a header and everything nested below it."""
+        return self.connection.execute(
+            'SELECT * FROM headers WHERE start >= ? AND start < ? ORDER BY start',
+            (row['start'], row['end'])).fetchall()
+
+    def read(self, row, children=True):
+        """Return the bytes of a header's section, with or without its children."""
+        end = row['end'] if children else row['body_end']
+        with open(self.source, 'rb') as f:
+            f.seek(row['start'])
+            return f.read(end - row['start'])
+
+def print_rows(rows):
+    """Print header rows as an indented outline with their byte ranges."""
+    for row in rows:
+        indent = '  ' * (row['depth'] - 1)
+        written = f" (written {row['number']})" if row['number'] != row['position'] else ''
+        print(f"{indent}{row['position']} {row['title']}{written} [{row['start']}:{row['end']}]")
+
+def main():
+    parser = argparse.ArgumentParser(description='Index a Markdown tutorial by section and read sections by byte range.')
+    parser.add_argument('--index', help='Index file (default: the document path with .outline.db appended)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='Build or rebuild the index of a document')
+    build_parser.add_argument('document')
+
+    list_parser = commands.add_parser('list', help='Print the outline of a document')
+    list_parser.add_argument('document')
+    list_parser.add_argument('--depth', type=int, help='Only show headers down to this depth')
+
+    get_parser = commands.add_parser('get', help='Print one section')
+    get_parser.add_argument('document')
+    get_parser.add_argument('key', help='Position ("3.2"), written number, anchor ("section-3-2") or slug')
+    get_parser.add_argument('--no-children', action='store_true',
+                            help='Stop at the first nested header')
+
+    subtree_parser = commands.add_parser('subtree', help='Print the outline below one section')
+    subtree_parser.add_argument('document')
+    subtree_parser.add_argument('key', help='Position ("3.2"), written number, anchor ("section-3-2") or slug')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        index = OutlineIndex.build(args.document, args.index)
+        count = index.connection.execute('SELECT COUNT(*) FROM headers').fetchone()[0]
+        print(f"Indexed {count} headers of {args.document} in {index.index_file}")
+        index.close()
+        return
+
+    index = OutlineIndex.open(args.document, args.index)
+    try:
+        if args.command == 'list':
+            print_rows(index.outline(args.depth))
+            return
+
+        row = index.find(args.key)
+        if row is None:
+            print(f"Error: no section {args.key} in {args.document}", file=sys.stderr)
+            sys.exit(1)
+        if args.command == 'get':
+            sys.stdout.buffer.write(index.read(row, children=not args.no_children))
+        else:
+            print_rows(index.subtree(row))
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
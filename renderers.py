@@ -0,0 +1,353 @@
+import os
+import re
+import json
+import html
+
+from header_lexer import FENCE_PATTERN, HeaderLexer, HeaderRanges, lex_line
+from instrumentation import METRICS
+
+FORMATS = ('markdown', 'html', 'json')
+
+# ID of an anchor line written before a numbered header
+ANCHOR_ID_PATTERN = re.compile(r'<a\s+id="([^"]+)"')
+
+# Links to a numbered header; the number before the first dash picks the page
+SECTION_LINK_PATTERN = re.compile(r'#section-(\d+)')
+
+# Inline Markdown, tried in this order at each position
+INLINE_PATTERN = re.compile(
+    r'(?P<ticks>`+)(?P<code>.+?)(?P=ticks)'
+    r'|!\[(?P<alt>[^\]]*)\]\(<?(?P<src>[^)\s>]+)>?(?:\s+"[^"]*")?\)'
+    r'|\[(?P<text>[^\]]*)\]\(<?(?P<href>[^)\s>]+)>?(?:\s+"[^"]*")?\)'
+    r'|\*\*(?P<strong>.+?)\*\*'
+    r'|(?<!\w)[*_](?P<em>[^*_\s](?:[^*_]*?[^*_\s])?)[*_](?!\w)'
+)
+
+LIST_ITEM_PATTERN = re.compile(r'( *)([-*+]|\d+[.)])\s+(.*)')
+RULE_PATTERN = re.compile(r' {0,3}([-*_])(?: *\1){2,} *$')
+TABLE_SEPARATOR_PATTERN = re.compile(r'\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$')
+
+def format_output(output_file, fmt):
+    """Return where a format is written, given the Markdown output path."""
+    name, ext = os.path.splitext(output_file)
+    if fmt == 'html':
+        return name + '_html'
+    if fmt == 'json':
+        return name + '.outline.json'
+    return output_file
+
+def page_name(path):
+    """Return the HTML fragment holding the header numbered path."""
+    return f'section-{path[0]}.html'
+
+def page_href(href, pages=None):
+    """Point links to numbered headers at the fragment that holds them.
+
+    pages maps slug anchors to their fragments; numbered anchors name
+    their section themselves.
+    """
+    if pages and href[:1] == '#' and href[1:] in pages:
+        return pages[href[1:]] + href
+    match = SECTION_LINK_PATTERN.match(href)
+    if match is None:
+        return href
+    return page_name((match.group(1),)) + href
+
+def render_inline(text, pages=None):
+    """Convert inline Markdown (code, links, images, emphasis) to escaped HTML; pages is passed to page_href."""
+    parts = []
+    position = 0
+    for match in INLINE_PATTERN.finditer(text):
+        parts.append(html.escape(text[position:match.start()], quote=False))
+        position = match.end()
+        if match.group('ticks'):
+            parts.append(f"<code>{html.escape(match.group('code').strip(), quote=False)}</code>")
+        elif match.group('src') is not None:
+            parts.append(f'<img src="{html.escape(match.group("src"))}" alt="{html.escape(match.group("alt"))}">')
+        elif match.group('href') is not None:
+            href = html.escape(page_href(match.group('href'), pages))
+            parts.append(f'<a href="{href}">{render_inline(match.group("text"), pages)}</a>')
+        elif match.group('strong') is not None:
+            parts.append(f"<strong>{render_inline(match.group('strong'), pages)}</strong>")
+        else:
+            parts.append(f"<em>{render_inline(match.group('em'), pages)}</em>")
+    parts.append(html.escape(text[position:], quote=False))
+    return ''.join(parts)
+
+def table_cells(row):
+    """Split a pipe table row into its cell texts."""
+    row = row.strip()
+    if row.startswith('|'):
+        row = row[1:]
+    if row.endswith('|'):
+        row = row[:-1]
+    return [cell.strip() for cell in row.split('|')]
+
+class MarkdownRenderer:
+    """Write the renumbered document as Markdown."""
+
+    def __init__(self, path):
+        self.path = path
+        self.out = open(path, 'w', encoding='utf-8')
+        self.separator = ''
+
+    def feed(self, kind, text, path, header):
+        self.out.write(self.separator)
+        self.out.write(text)
+        self.separator = '\n'
+
+    def close(self):
+        self.out.close()
+        METRICS.wrote(self.path)
+
+class OutlineRenderer:
+    """Write the outline of the renumbered document as a JSON tree.
+
+    Every numbered header becomes a node with its number, anchor, title,
+    Markdown level, line and the byte range [start, end) it covers in the
+    renumbered Markdown, from its anchor line up to the next header of any
+    kind with the same or a higher level (see HeaderRanges). With pages, nodes also name the HTML fragment
+    that holds them.
+    """
+
+    def __init__(self, path, pages=False):
+        self.path = path
+        self.pages = pages
+        self.offset = 0
+        self.lines = 0
+        self.sections = []
+        self.ranges = HeaderRanges()
+        self.lexer = HeaderLexer()
+
+    def feed(self, kind, text, path, header):
+        start = self.offset + 1 if self.lines else 0
+        self.offset = start + len(text.encode('utf-8'))
+        self.lines += 1
+        if kind != 'anchor':
+            token = self.lexer.feed(text)
+            if token is not None and kind != 'header':
+                for node in self.ranges.end(token.level):
+                    node['end'] = start
+            return
+
+        for node in self.ranges.end(header.level, len(path)):
+            node['end'] = start
+        parent = self.ranges.top()
+        node = {
+            'number': '.'.join(str(n) for n in path),
+            'anchor': ANCHOR_ID_PATTERN.match(text).group(1),
+            'title': header.title,
+            'level': header.level,
+            # The header line follows its anchor
+            'line': self.lines + 1,
+            'start': start,
+            'end': None
+        }
+        if self.pages:
+            node['page'] = page_name(path)
+        node['children'] = []
+        (parent['children'] if parent else self.sections).append(node)
+        self.ranges.push(node, header.level, len(path))
+
+    def close(self):
+        for node in self.ranges.close():
+            node['end'] = self.offset
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'bytes': self.offset, 'sections': self.sections}, f, ensure_ascii=False, indent=1)
+        METRICS.wrote(self.path)
+
+class HtmlRenderer:
+    """Write the renumbered document as one HTML fragment per section.
+
+    Text outside the sections (title, TOC, group headers and their intros)
+    goes to index.html and every section, with everything nested in it, to
+    section-N.html; a section ends where HeaderRanges says it does. Links
+    to numbered headers are pointed at the fragment that holds them.
+    Covers the Markdown the tutorials use: headers, fenced code, lists,
+    pipe tables, quotes, rules, raw HTML lines and inline markup. pages
+    maps slug anchors to their fragments (see page_href).
+    """
+
+    def __init__(self, directory, pages=None):
+        self.directory = directory
+        self.pages = pages
+        os.makedirs(directory, exist_ok=True)
+        self.block = None
+        self.block_lines = []
+        self.lists = []
+        self.fence = None
+        self.anchor = None
+        self.ranges = HeaderRanges()
+        self.index_page = os.path.join(directory, 'index.html')
+        self.index = open(self.index_page, 'w', encoding='utf-8')
+        self.out = self.index
+        self.page = None
+
+    def open_section(self, path):
+        self.close_section()
+        self.close_blocks()
+        self.page = os.path.join(self.directory, page_name(path))
+        self.out = open(self.page, 'w', encoding='utf-8')
+
+    def close_section(self):
+        """Finish the open section fragment and go back to index.html."""
+        if self.out is self.index:
+            return
+        self.close_blocks()
+        self.out.close()
+        METRICS.wrote(self.page)
+        self.out = self.index
+
+    def inline(self, text):
+        return render_inline(text, self.pages)
+
+    def feed(self, kind, text, path, header):
+        if kind == 'anchor':
+            if len(path) == 1:
+                self.ranges.end(header.level, 1)
+                self.ranges.push(path, header.level, 1)
+                self.open_section(path)
+            self.anchor = ANCHOR_ID_PATTERN.match(text).group(1)
+            return
+        self.feed_line(text, kind == 'header')
+
+    def feed_line(self, line, numbered=False):
+        fence = FENCE_PATTERN.match(line)
+        if self.fence is not None:
+            marker = self.fence[0]
+            if (fence and fence.group(1)[0] == marker[0] and len(fence.group(1)) >= len(marker)
+                    and not fence.group(2).strip()):
+                self.close_fence()
+            else:
+                self.block_lines.append(line)
+            return
+        if fence:
+            self.close_blocks()
+            self.fence = (fence.group(1), fence.group(2).strip())
+            return
+
+        stripped = line.strip()
+        token = lex_line(line) if line[:1] == '#' else None
+        if not stripped:
+            self.close_blocks()
+        elif token is not None:
+            self.close_blocks()
+            if not numbered and self.ranges.end(token.level):
+                self.close_section()
+            level = min(token.level, 6)
+            anchor = f' id="{html.escape(self.anchor)}"' if self.anchor else ''
+            self.out.write(f'<h{level}{anchor}>{self.inline(line[token.level:].strip())}</h{level}>\n')
+            self.anchor = None
+        elif RULE_PATTERN.match(line):
+            self.close_blocks()
+            self.out.write('<hr>\n')
+        elif stripped.startswith('>'):
+            self.add_to_block('quote', stripped[1:].strip())
+        elif stripped.startswith('|'):
+            self.add_to_block('table', stripped)
+        elif LIST_ITEM_PATTERN.match(line):
+            self.add_list_item(*LIST_ITEM_PATTERN.match(line).groups())
+        elif stripped.startswith('<') and self.block is None:
+            self.out.write(line + '\n')
+        elif self.lists and self.block is None:
+            # A continuation line of the last list item
+            self.out.write(' ' + self.inline(stripped))
+        else:
+            self.add_to_block('paragraph', stripped)
+
+    def add_to_block(self, block, line):
+        if self.block != block:
+            self.close_blocks()
+            self.block = block
+        self.block_lines.append(line)
+
+    def add_list_item(self, indent, marker, text):
+        """Open, continue or close nested lists by the item's indentation."""
+        self.flush_block()
+        indent = len(indent)
+        tag = 'ol' if marker[0].isdigit() else 'ul'
+        while self.lists and indent < self.lists[-1][0]:
+            self.out.write(f'</li></{self.lists.pop()[1]}>\n')
+        if self.lists and indent == self.lists[-1][0]:
+            self.out.write('</li>\n')
+        else:
+            self.lists.append((indent, tag))
+            self.out.write(f'<{tag}>\n')
+        self.out.write(f'<li>{self.inline(text)}')
+
+    def close_fence(self):
+        marker, language = self.fence
+        language = f' class="language-{html.escape(language.split()[0])}"' if language else ''
+        code = html.escape('\n'.join(self.block_lines), quote=False)
+        self.out.write(f'<pre><code{language}>{code}</code></pre>\n')
+        self.fence = None
+        self.block_lines = []
+
+    def flush_block(self):
+        """Write the buffered paragraph, quote or table."""
+        lines = self.block_lines
+        if self.block == 'paragraph':
+            self.out.write(f"<p>{self.inline(' '.join(lines))}</p>\n")
+        elif self.block == 'quote':
+            self.out.write(f"<blockquote><p>{self.inline(' '.join(lines))}</p></blockquote>\n")
+        elif self.block == 'table':
+            if len(lines) >= 2 and TABLE_SEPARATOR_PATTERN.match(lines[1]):
+                head = ''.join(f'<th>{self.inline(cell)}</th>' for cell in table_cells(lines[0]))
+                self.out.write(f'<table>\n<thead><tr>{head}</tr></thead>\n<tbody>\n')
+                for row in lines[2:]:
+                    cells = ''.join(f'<td>{self.inline(cell)}</td>' for cell in table_cells(row))
+                    self.out.write(f'<tr>{cells}</tr>\n')
+                self.out.write('</tbody>\n</table>\n')
+            else:
+                self.out.write(f"<p>{self.inline(' '.join(lines))}</p>\n")
+        self.block = None
+        self.block_lines = []
+
+    def close_blocks(self):
+        """End the current block and any open lists."""
+        self.flush_block()
+        while self.lists:
+            self.out.write(f'</li></{self.lists.pop()[1]}>\n')
+
+    def close(self):
+        if self.fence is not None:
+            self.close_fence()
+        self.close_section()
+        self.close_blocks()
+        self.index.close()
+        METRICS.wrote(self.index_page)
+
+def open_renderers(output_file, formats, pages=None):
+    """Return a renderer for each format, writing next to output_file."""
+    renderers = []
+    for fmt in formats:
+        target = format_output(output_file, fmt)
+        if fmt == 'markdown':
+            renderers.append(MarkdownRenderer(target))
+        elif fmt == 'json':
+            renderers.append(OutlineRenderer(target, pages='html' in formats))
+        elif fmt == 'html':
+            renderers.append(HtmlRenderer(target, pages))
+        else:
+            raise ValueError(f'unknown output format: {fmt}')
+    return renderers
+
+def render_document(events, output_file, formats, anchors=None):
+    """Feed one stream of document events to the renderers of every format.
+
+    events are the (kind, text, path, header) tuples of
+    renumber_tutorial.iter_document and anchors the anchor IDs by number
+    path when they are not numbered. Returns the paths written to.
+    """
+    pages = None
+    if anchors is not None:
+        pages = {anchor: page_name(path) for path, anchor in anchors.items()}
+    renderers = open_renderers(output_file, formats, pages)
+    try:
+        for event in events:
+            for renderer in renderers:
+                renderer.feed(*event)
+    finally:
+        for renderer in renderers:
+            renderer.close()
+    return [format_output(output_file, fmt) for fmt in formats]
@@ -1,304 +1,495 @@
+import io
 import os
 import re
+import sys
+import glob
+import mmap
+import time
+import bisect
 import argparse
-import unicodedata
-
-def slugify(text):
-    """Convert text to a format suitable for use in URLs and anchors."""
-    # Normalize unicode characters
-    text = unicodedata.normalize('NFKD', text)
-    # Convert to ASCII, ignore non-ASCII characters
-    ascii_text = ''.join(c for c in text if not unicodedata.combining(c) and ord(c) < 128)
-    # Convert to lowercase
-    ascii_text = ascii_text.lower()
-    # Replace spaces with hyphens
-    ascii_text = ascii_text.replace(' ', '-')
-    # Remove non-alphanumeric characters
-    ascii_text = re.sub(r'[^a-z0-9\-]', '', ascii_text)
-    # Replace multiple hyphens with a single hyphen
-    ascii_text = re.sub(r'-+', '-', ascii_text)
-    # Remove leading and trailing hyphens
-    ascii_text = ascii_text.strip('-')
-    
-    # If we have only numbers after processing, add a prefix
-    if re.match(r'^\d+$', ascii_text):
-        ascii_text = f"section-{ascii_text}"
-        
-    return ascii_text
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from cross_references import ReferenceRewriter, print_unresolved
+from doc_cache import CACHE_DIR, DocumentCache
+from instrumentation import METRICS, add_instrumentation_arguments, instrumented
+from header_lexer import (HeaderLexer, count_newlines, is_section_header, is_toc_header, iter_headers, iter_headers_bytes,
+                          iter_shard_headers, lex_line, scan_shard)
+from renderers import FORMATS, render_document
+from slugs import ANCHOR_STYLES, SlugRegistry, slugify
+
+# A single rewrite: replace [start, end) with text (start == end inserts)
+Edit = namedtuple('Edit', ['start', 'end', 'text'])
+
+# Anchors inserted by a previous run, by anchor style. Numbered anchors are
+# removed anywhere; slug anchors only with --anchors slug and only on the line
+# right before a numbered header, so hand-written anchors survive numbered runs.
+# Raw bytes may still hold CRLF line ends
+ANCHOR_TEXTS = {
+    'number': r'<a\s+id="section-\d+(?:-\d+)*">\s*</a>\r?\n',
+    'slug': (r'<a\s+id="(?:section-\d+(?:-\d+)*">\s*</a>\r?\n'
+             r'|[a-z0-9][a-z0-9-]*">\s*</a>\r?\n(?=#+[ \t]*\d))'),
+}
+ANCHOR_PATTERNS = {style: re.compile(text) for style, text in ANCHOR_TEXTS.items()}
+
+# The same anchors matched on raw bytes for --mmap
+ANCHOR_BYTES_PATTERNS = {style: re.compile(text.encode('ascii')) for style, text in ANCHOR_TEXTS.items()}
+
+ANCHOR_PATTERN = ANCHOR_PATTERNS['number']
+ANCHOR_BYTES_PATTERN = ANCHOR_BYTES_PATTERNS['number']
+
+class Header:
+    """A numbered header of the outline: a section or a header nested at any depth.
+    
+    Keeps the line the lexer produced (shared with the document's line list
+    in text mode) and slices the title from it on access. children is an
+    empty tuple until the first nested header is added.
+    """
+    __slots__ = ('index', 'offset', 'level', 'numbers', 'line', 'title_span', 'number_end', 'children')
+    
+    def __init__(self, token):
+        self.index = token.index
+        self.offset = token.offset
+        self.level = token.level
+        self.numbers = token.numbers
+        self.line = token.line
+        self.title_span = token.title_span
+        self.number_end = token.number_span[1]
+        self.children = ()
+    
+    @property
+    def title(self):
+        """Header text after the number path."""
+        start, end = self.title_span
+        return self.line[start:end]
+    
+    def add_child(self, header):
+        """Nest a header one level deeper under this header."""
+        if not self.children:
+            self.children = []
+        self.children.append(header)
 
-def clean_existing_anchors(content):
-    """Remove any existing HTML anchors from the content."""
-    # Pattern to match anchor tags
-    anchor_pattern = r'<a\s+id="section-\d+(?:-\d+)*">\s*</a>\n'
+def clean_existing_anchors(content, anchor_style='number'):
+    """Remove the HTML anchors a previous run with anchor_style inserted from the content."""
     # Replace anchors with empty string
-    cleaned_content = re.sub(anchor_pattern, '', content)
+    cleaned_content, removed = ANCHOR_PATTERNS[anchor_style].subn('', content)
+    METRICS.match('anchor', removed)
     return cleaned_content
 
-def parse_document(content):
-    """Parse the document and identify all sections and subsections up to 4 levels deep."""
-    # First clean any existing anchors to prevent duplication
-    content = clean_existing_anchors(content)
+def outline_depth(token):
+    """Return the outline depth a header token can take, or 0 if it is not numbered like one.
     
-    # Split content into lines
-    lines = content.split('\n')
+    Sections are "# N. Title" or "## N. Title"; a header at depth D > 1 has
+    D + 1 hashes and a D-part number path ("### N.M Title", "#### N.M.K Title",
+    "##### N.M.K.L Title", ...). Subsections may also drop the space after
+    the hashes ("###N.M Title") unless the number ends with a dot.
+    """
+    if not token.title:
+        return 0
+    if is_section_header(token):
+        return 1
+    depth = len(token.numbers)
+    if depth < 2 or token.level != depth + 1:
+        return 0
+    if token.spaced or (depth == 2 and not token.trailing_dot):
+        return depth
+    return 0
+
+def build_outline(tokens):
+    """Build the section outline from a stream of header tokens.
     
-    # Initialize section tracking
+    Returns a dict with the sections (Header objects with their nested
+    headers, to any depth), the tokens of the TOC header and of the header
+    that ends the TOC (None if missing) and the debug counters. A single
+    stack holds the open header of every depth, so each token is handled in
+    constant time. Token indexes and offsets are copied as-is, so the same
+    builder serves both the line-based and the byte-based (memory-mapped)
+    parsers.
+    """
+    # Initialize section tracking; stack[d - 1] is the open header at depth d
     sections = []
-    current_section = None
-    current_subsection = None
-    current_subsubsection = None
-    toc_lines = []
-    toc_start = -1
-    toc_end = -1
+    stack = []
+    toc_start = None
+    toc_end = None
     
-    # Debug counters
-    debug_patterns = {
-        'section_matches': 0,
-        'subsection_matches': 0,
-        'subsubsection_matches': 0,
-        'unmatched_headers': []
-    }
+    # Debug counters; matches[d - 1] counts the headers found at depth d
+    matches = [0, 0, 0]
+    unmatched = []
     
-    # Find TOC boundaries and sections
+    # Find TOC boundaries and sections; the lexer classifies each line once
+    # and skips fenced code blocks, so only header lines reach this loop
     in_toc = False
-    for i, line in enumerate(lines):
+    for token in tokens:
+        i = token.index
+        
         # Look for TOC start
-        if re.match(r'^#+\s+Содержание', line) or re.match(r'^#+\s+Оглавление', line):
-            toc_start = i
+        if is_toc_header(token):
+            toc_start = token
+            toc_end = None
             in_toc = True
-            toc_lines.append(line)
             continue
             
-        # If we're in TOC, collect lines until we hit a non-TOC section
+        # If we're in TOC, skip headers until we hit a non-TOC section
         if in_toc:
-            if re.match(r'^#+\s+', line) and not re.match(r'^###\s+', line):  # Major header, not a TOC subsection
-                toc_end = i - 1
+            if token.spaced and token.level != 3:  # Major header, not a TOC subsection
+                toc_end = token
                 in_toc = False
             else:
-                toc_lines.append(line)
                 continue
         
-        # Skip lines that might be leftover anchor tags
-        if re.match(r'<a\s+id="section-\d+(?:-\d+)*"></a>', line):
-            continue
-            
-        # Process main section headers (level 1-2)
-        section_match = re.match(r'^(#{1,2})\s+(\d+)\.(\s+.+)$', line)
-        if section_match:
-            hashes = section_match.group(1)
-            section_title = section_match.group(3)
-            
-            # Record section
-            section_info = {
-                'index': i,
-                'level': len(hashes),
-                'title': section_title.strip(),
-                'line': line,
-                'subsections': []
-            }
-            sections.append(section_info)
-            current_section = section_info
-            current_subsection = None
-            current_subsubsection = None
-            debug_patterns['section_matches'] += 1
+        # A header nests under the open header one level up, closing any deeper ones
+        depth = outline_depth(token)
+        if depth and len(stack) >= depth - 1:
+            header = Header(token)
+            del stack[depth - 1:]
+            if stack:
+                stack[-1].add_child(header)
+            else:
+                sections.append(header)
+            stack.append(header)
+            if depth > len(matches):
+                matches.append(0)
+            matches[depth - 1] += 1
             continue
-            
-        # Process level 3 headers (subsections) - try multiple patterns
-        if current_section:
-            # Try pattern 1: ### N.M Title
-            subsection_match = re.match(r'^(#{3})\s+(\d+)\.(\d+)(\s+.+)$', line)
-            
-            # Try pattern 2: ### N.M. Title (note the extra dot)
-            if not subsection_match:
-                alt_match = re.match(r'^(#{3})\s+(\d+)\.(\d+)\.(\s+.+)$', line)
-                if alt_match:
-                    subsection_match = alt_match
-                    # Adjust groups to match the expected format from pattern 1
-                    subsection_match = re.match(r'^(#{3})\s+(\d+)\.(\d+)(\..+)$', line)
-            
-            # Try pattern 3: ###N.M Title (no space after ###)
-            if not subsection_match:
-                alt_match = re.match(r'^(#{3})(\d+)\.(\d+)(\s+.+)$', line)
-                if alt_match:
-                    subsection_match = alt_match
-            
-            if subsection_match:
-                hashes = subsection_match.group(1)
-                section_num = subsection_match.group(2)
-                subsection_num = subsection_match.group(3)
-                subsection_title = subsection_match.group(4)
-                
-                # Record subsection
-                subsection_info = {
-                    'index': i,
-                    'level': len(hashes),
-                    'section_num': section_num,
-                    'number': subsection_num,
-                    'title': subsection_title.strip(),
-                    'line': line,
-                    'subsubsections': []
-                }
-                current_section['subsections'].append(subsection_info)
-                current_subsection = subsection_info
-                current_subsubsection = None
-                debug_patterns['subsection_matches'] += 1
-                continue
-        
-        # Process level 4 headers (sub-subsections) - try multiple patterns
-        if current_subsection:
-            # Try pattern 1: #### N.M.K Title
-            subsubsection_match = re.match(r'^(#{4})\s+(\d+)\.(\d+)\.(\d+)(\s+.+)$', line)
-            
-            # Try pattern 2: #### N.M.K. Title (note the extra dot)
-            if not subsubsection_match:
-                alt_match = re.match(r'^(#{4})\s+(\d+)\.(\d+)\.(\d+)\.(\s+.+)$', line)
-                if alt_match:
-                    subsubsection_match = alt_match
-                    # Adjust groups to match expected format
-                    subsubsection_match = re.match(r'^(#{4})\s+(\d+)\.(\d+)\.(\d+)(\..+)$', line)
-            
-            if subsubsection_match:
-                hashes = subsubsection_match.group(1)
-                section_num = subsubsection_match.group(2)
-                subsection_num = subsubsection_match.group(3)
-                subsubsection_num = subsubsection_match.group(4)
-                subsubsection_title = subsubsection_match.group(5)
-                
-                # Record sub-subsection
-                subsubsection_info = {
-                    'index': i,
-                    'level': len(hashes),
-                    'section_num': section_num,
-                    'subsection_num': subsection_num,
-                    'number': subsubsection_num,
-                    'title': subsubsection_title.strip(),
-                    'line': line
-                }
-                current_subsection['subsubsections'].append(subsubsection_info)
-                current_subsubsection = subsubsection_info
-                debug_patterns['subsubsection_matches'] += 1
-                continue
         
         # Log any header-like lines that weren't matched
-        if not in_toc and re.match(r'^#{1,4}\s+.+$', line):
-            debug_patterns['unmatched_headers'].append((i+1, line))
+        if token.spaced and (token.numbers or (token.level <= 4 and token.title)):
+            unmatched.append((i+1, token.line))
+    
+    METRICS.match('section', matches[0])
+    METRICS.match('subsection', matches[1])
+    METRICS.match('subsubsection', matches[2])
+    METRICS.match('deeper', sum(matches[3:]))
+    return {
+        'sections': sections,
+        'toc_start': toc_start,
+        'toc_end': toc_end,
+        'debug': {
+            'section_matches': matches[0],
+            'subsection_matches': matches[1],
+            'subsubsection_matches': matches[2],
+            'deeper_matches': sum(matches[3:]),
+            'unmatched_headers': unmatched
+        }
+    }
+
+def parse_document(content, anchor_style='number'):
+    """Parse the document and identify all sections and their nested headers at any depth."""
+    # First clean any existing anchors to prevent duplication
+    content = clean_existing_anchors(content, anchor_style)
+    
+    # Split content into lines
+    lines = content.split('\n')
+    
+    return build_document(lines, iter_headers(lines))
+
+def build_document(lines, tokens):
+    """Build the parsed document model from lines without anchors and their header tokens."""
+    outline = build_outline(tokens)
     
-    # If TOC end wasn't found, set it to last TOC line
-    if toc_end == -1 and toc_start != -1 and len(toc_lines) > 1:
-        toc_end = toc_start + len(toc_lines) - 1
+    # The TOC runs up to the line before the header that ends it; if TOC end
+    # wasn't found, set it to the last line
+    toc_start = -1
+    toc_end = -1
+    toc_lines = []
+    if outline['toc_start'] is not None:
+        toc_start = outline['toc_start'].index
+        if outline['toc_end'] is not None:
+            toc_end = outline['toc_end'].index - 1
+        elif toc_start < len(lines) - 1:
+            toc_end = len(lines) - 1
+        toc_lines = lines[toc_start:toc_end + 1]
     
     return {
         'lines': lines,
-        'sections': sections,
+        'sections': outline['sections'],
         'toc': {
             'start': toc_start,
             'end': toc_end,
             'lines': toc_lines
         },
-        'debug': debug_patterns
+        'debug': outline['debug']
     }
 
-def generate_toc(sections):
-    """Generate a table of contents from sections with up to 4 levels of depth."""
+def parse_document_cached(content, cache=None, anchor_style='number'):
+    """Parse a document, reusing the model cached for identical content.
+    
+    Entries hold the outline and TOC but not the lines, which are rebuilt
+    from content on a hit.
+    """
+    if cache is None:
+        return parse_document(content, anchor_style)
+    key = cache.key(content, anchor_style)
+    entry = cache.get(key)
+    if entry is not None:
+        return dict(entry, lines=clean_existing_anchors(content, anchor_style).split('\n'))
+    doc_info = parse_document(content, anchor_style)
+    try:
+        cache.put(key, {name: value for name, value in doc_info.items() if name != 'lines'})
+    except OSError as e:
+        print(f"Warning: could not write parse cache: {e}")
+    return doc_info
+
+def generate_toc(sections, max_depth=None, anchors=None):
+    """Generate a table of contents from sections, down to max_depth levels (all by default).
+    
+    anchors maps number paths to anchor IDs (see header_anchors); without
+    it the links use the numbered anchors.
+    """
     toc = ["# Содержание\n"]
     
-    for i, section in enumerate(sections, 1):
-        # Generate a proper heading ID
-        section_text = f"{i}. {section['title']}"
-        section_slug = slugify(section_text)
-        
-        # For sections, we'll use a simple, reliable format
-        section_id = f"section-{i}"
+    for header, path in iter_numbered_headers(sections, max_depth):
+        if len(path) == 1:
+            # Sections keep a trailing dot and are indented by their own level
+            text = f"{path[0]}. {header.title}"
+            indent = "  " * (header.level - 1)
+        else:
+            text = f"{'.'.join(str(n) for n in path)} {header.title}"
+            indent = "  " * header.level
         
-        # Add section to TOC
-        indent = "  " * (section['level'] - 1)
-        toc.append(f"{indent}- [{section_text}](#{section_id})")
-        
-        # Add subsections to TOC if present
-        for j, subsection in enumerate(section['subsections'], 1):
-            # Generate a proper heading ID for subsection
-            subsection_text = f"{i}.{j} {subsection['title']}"
-            subsection_id = f"section-{i}-{j}"
-            
-            sub_indent = "  " * subsection['level']
-            toc.append(f"{sub_indent}- [{subsection_text}](#{subsection_id})")
-            
-            # Add sub-subsections to TOC if present
-            for k, subsubsection in enumerate(subsection.get('subsubsections', []), 1):
-                # Generate a proper heading ID for sub-subsection
-                subsubsection_text = f"{i}.{j}.{k} {subsubsection['title']}"
-                subsubsection_id = f"section-{i}-{j}-{k}"
-                
-                subsub_indent = "  " * subsubsection['level']
-                toc.append(f"{subsub_indent}- [{subsubsection_text}](#{subsubsection_id})")
+        toc.append(f"{indent}- [{text}](#{header_anchor(path, anchors)})")
     
     return toc
 
-def renumber_document(doc_info):
-    """Renumber all sections and subsections in the document up to 4 levels deep."""
-    lines = doc_info['lines'].copy()
-    sections = doc_info['sections']
+def iter_numbered_headers(sections, max_depth=None):
+    """Yield (header, number path) for all headers in document order, down to max_depth levels.
+    
+    Walks the outline with an explicit stack of child iterators, so deep
+    outlines need no recursion.
+    """
+    stack = [(enumerate(sections, 1), ())]
+    while stack:
+        children, parent_path = stack[-1]
+        for number, header in children:
+            path = parent_path + (number,)
+            yield header, path
+            if header.children and (max_depth is None or len(path) < max_depth):
+                stack.append((enumerate(header.children, 1), path))
+                break
+        else:
+            stack.pop()
+
+def anchor_id(path):
+    """Return the HTML anchor ID for a number path, e.g. section-4-3-1."""
+    return 'section-' + '-'.join(str(n) for n in path)
+
+def header_anchors(sections, max_depth=None, style='number'):
+    """Return the anchor IDs of the numbered headers by number path, or None for numbered anchors.
     
-    # Generate new TOC
-    new_toc = generate_toc(sections)
+    With style 'slug' every header gets a transliterated slug of its title,
+    made unique within the document with GitHub-style -1, -2 suffixes;
+    titles without letters or digits keep the numbered anchor. Slugs do
+    not change when the document is renumbered.
+    """
+    if style == 'number':
+        return None
+    registry = SlugRegistry()
+    return {path: registry.unique(slugify(header.title) or anchor_id(path))
+            for header, path in iter_numbered_headers(sections, max_depth)}
+
+def header_anchor(path, anchors=None):
+    """Return the anchor ID of the header numbered path."""
+    return anchor_id(path) if anchors is None else anchors[path]
+
+def anchor_line(path, anchors=None):
+    """Return the HTML anchor placed before the header numbered path."""
+    return f'<a id="{header_anchor(path, anchors)}"></a>'
+
+def renumber_header_line(header, path):
+    """Return a header's line renumbered to path.
+    
+    Keeps the trailing dot style of the original number ("### 4.2." or "### 4.2").
+    """
+    number = '.'.join(str(n) for n in path)
+    return '#' * header.level + f' {number}' + header.line[header.number_end:]
+
+def count_outline(sections):
+    """Return the number of sections, subsections, sub-subsections and deeper headers."""
+    counts = [0, 0, 0, 0]
+    for header, path in iter_numbered_headers(sections):
+        counts[min(len(path), 4) - 1] += 1
+    return tuple(counts)
+
+def reference_rewriter(sections, max_depth=None):
+    """Return a ReferenceRewriter from the written numbers of the outline's headers to their new numbers.
     
-    # Replace old TOC
+    Headers deeper than max_depth keep their numbers, and a number written
+    on more than one header is ambiguous.
+    """
+    numbers = {}
+    for header, path in iter_numbered_headers(sections):
+        new = path if max_depth is None or len(path) <= max_depth else header.numbers
+        numbers[header.numbers] = None if header.numbers in numbers else new
+    return ReferenceRewriter(numbers)
+
+def reference_edits(doc_info, rewriter, source=None):
+    """Return the line edits that renumber references in the body.
+    
+    Header lines, fenced code and the TOC are left to the other edits.
+    """
+    lines = doc_info['lines']
     toc_start = doc_info['toc']['start']
     toc_end = doc_info['toc']['end']
+    edits = []
+    lexer = HeaderLexer()
+    for index, line in enumerate(lines):
+        if lexer.feed(line) is not None or lexer.fence is not None or toc_start <= index <= toc_end:
+            continue
+        new_line = rewriter.rewrite(line, index + 1, source)
+        if new_line is not line:
+            edits.append(Edit(index, index + 1, new_line))
+    return edits
+
+def removed_anchor_lines(content, anchor_style='number'):
+    """Return, for each anchor clean_existing_anchors removes, the index of the line it preceded."""
+    removed = []
+    newlines = 0
+    last = 0
+    for count, match in enumerate(ANCHOR_PATTERNS[anchor_style].finditer(content)):
+        newlines += content.count('\n', last, match.start())
+        last = match.start()
+        removed.append(newlines - count)
+    return removed
+
+def input_line_number(removed, line_number):
+    """Translate a line number of the anchor-free document back to a line of the input."""
+    return line_number + bisect.bisect_right(removed, line_number - 1)
+
+def build_edits(doc_info, max_depth=None, references=(), anchors=None):
+    """Turn a parsed document into an ordered list of line edits.
     
+    Each Edit replaces lines[start:end] with text; an edit with start == end
+    inserts text before line start. Edits refer to the original line
+    indexes, so no index fix-ups are needed when the TOC changes size.
+    Headers deeper than max_depth keep their numbers and get no anchor.
+    references holds extra body line edits from reference_edits and
+    anchors the anchor IDs from header_anchors.
+    """
+    lines = doc_info['lines']
+    sections = doc_info['sections']
+    edits = []
+    
+    # Replace old TOC with the generated one
+    toc_start = doc_info['toc']['start']
+    toc_end = doc_info['toc']['end']
     if toc_start >= 0 and toc_end >= toc_start:
-        # Remove old TOC
-        lines = lines[:toc_start] + lines[toc_end+1:]
-        
-        # Insert new TOC
-        lines = lines[:toc_start] + new_toc + lines[toc_start:]
-        
-        # Adjust section indices for the TOC change
-        toc_diff = len(new_toc) - (toc_end - toc_start + 1)
-        for section in sections:
-            if section['index'] > toc_end:
-                section['index'] += toc_diff
-            for subsection in section['subsections']:
-                if subsection['index'] > toc_end:
-                    subsection['index'] += toc_diff
-                for subsubsection in subsection.get('subsubsections', []):
-                    if subsubsection['index'] > toc_end:
-                        subsubsection['index'] += toc_diff
+        edits.append(Edit(toc_start, toc_end + 1, '\n'.join(generate_toc(sections, max_depth, anchors))))
     
     # Renumber sections and subsections and add HTML anchors
-    for i, section in enumerate(sections, 1):
-        old_index = section['index']
-        # Add HTML anchor before the section header
-        section_id = f"section-{i}"
-        lines[old_index] = f'<a id="{section_id}"></a>\n' + re.sub(r'^(#{1,2})\s+\d+\.', f"\\1 {i}.", lines[old_index])
+    for header, path in iter_numbered_headers(sections, max_depth):
+        index = header.index
+        edits.append(Edit(index, index, anchor_line(path, anchors)))
+        edits.append(Edit(index, index + 1, renumber_header_line(header, path)))
+    
+    edits.extend(references)
+    
+    # Sections may precede the TOC; inserts sort before replacements
+    edits.sort()
+    return edits
+
+def write_edits(lines, edits, out):
+    """Apply ordered line edits in one forward pass, writing to a file object.
+    
+    Untouched lines are written in runs between edits, so the document is
+    never copied as a whole.
+    """
+    position = 0
+    separator = ''
+    for start, end, text in edits:
+        if start > position:
+            out.write(separator)
+            out.write('\n'.join(lines[position:start]))
+            separator = '\n'
+        out.write(separator)
+        out.write(text)
+        separator = '\n'
+        position = max(position, end)
+    
+    if position < len(lines):
+        out.write(separator)
+        out.write('\n'.join(lines[position:]))
+
+def iter_document(doc_info, max_depth=None, references=(), anchors=None):
+    """Yield the renumbered document line by line as (kind, text, path, header) events.
+    
+    kind is 'anchor' for the anchor line before a numbered header, 'header'
+    for the renumbered header line, 'toc' for a line of the generated TOC and
+    'text' for any other line; path and header are set for the first two.
+    references and anchors are passed on as in build_edits.
+    Joining the texts with '\n' gives what write_edits writes, so renderers
+    of other formats see the same document from the same parse.
+    """
+    lines = doc_info['lines']
+    replaced = {edit.start: edit.text for edit in references}
+    numbered = {header.index: (header, path)
+                for header, path in iter_numbered_headers(doc_info['sections'], max_depth)}
+    toc_start = doc_info['toc']['start']
+    toc_end = doc_info['toc']['end']
+    if toc_start < 0 or toc_end < toc_start:
+        toc_start = -1
+    
+    i = 0
+    while i < len(lines):
+        if i == toc_start:
+            for line in '\n'.join(generate_toc(doc_info['sections'], max_depth, anchors)).split('\n'):
+                yield 'toc', line, None, None
+            i = toc_end + 1
+            continue
         
-        # Renumber subsections
-        for j, subsection in enumerate(section['subsections'], 1):
-            sub_index = subsection['index']
-            # Add HTML anchor
-            subsection_id = f"section-{i}-{j}"
-            
-            # Handle both patterns (with and without trailing dot)
-            if '.' in lines[sub_index].split()[1] and lines[sub_index].split()[1].endswith('.'):
-                lines[sub_index] = f'<a id="{subsection_id}"></a>\n' + re.sub(r'^(#{3})\s+\d+\.\d+\.', f"\\1 {i}.{j}.", lines[sub_index])
-            else:
-                lines[sub_index] = f'<a id="{subsection_id}"></a>\n' + re.sub(r'^(#{3})\s+\d+\.\d+', f"\\1 {i}.{j}", lines[sub_index])
-            
-            # Renumber sub-subsections
-            for k, subsubsection in enumerate(subsection.get('subsubsections', []), 1):
-                subsub_index = subsubsection['index']
-                # Add HTML anchor
-                subsubsection_id = f"section-{i}-{j}-{k}"
-                
-                # Handle both patterns (with and without trailing dot)
-                if '.' in lines[subsub_index].split()[1] and lines[subsub_index].split()[1].endswith('.'):
-                    lines[subsub_index] = f'<a id="{subsubsection_id}"></a>\n' + re.sub(r'^(#{4})\s+\d+\.\d+\.\d+\.', 
-                                               f"\\1 {i}.{j}.{k}.", lines[subsub_index])
-                else:
-                    lines[subsub_index] = f'<a id="{subsubsection_id}"></a>\n' + re.sub(r'^(#{4})\s+\d+\.\d+\.\d+', 
-                                               f"\\1 {i}.{j}.{k}", lines[subsub_index])
+        entry = numbered.get(i)
+        if entry is None:
+            yield 'text', replaced.get(i, lines[i]), None, None
+        else:
+            header, path = entry
+            yield 'anchor', anchor_line(path, anchors), path, header
+            yield 'header', renumber_header_line(header, path), path, header
+        i += 1
+
+class Difference(Exception):
+    """Raised by CompareWriter at the first character that differs."""
+    
+    def __init__(self, position):
+        super().__init__(position)
+        self.position = position
+
+class CompareWriter:
+    """File-like object that checks written text against an expected string.
+    
+    Nothing is kept: each write is compared in place and the first mismatch
+    raises Difference, so a check stops as early as possible.
+    """
+    
+    def __init__(self, expected):
+        self.expected = expected
+        self.position = 0
     
-    return '\n'.join(lines)
+    def write(self, text):
+        if not self.expected.startswith(text, self.position):
+            expected = self.expected[self.position:self.position + len(text)]
+            raise Difference(self.position + len(os.path.commonprefix([expected, text])))
+        self.position += len(text)
+    
+    def close(self):
+        """Check that the whole expected string was written."""
+        if self.position != len(self.expected):
+            raise Difference(self.position)
+
+def find_difference(content, lines, edits):
+    """Return the line number where content differs from lines with edits applied, or None."""
+    writer = CompareWriter(content)
+    try:
+        write_edits(lines, edits, writer)
+        writer.close()
+    except Difference as e:
+        return content.count('\n', 0, e.position) + 1
+    return None
+
+def renumber_document(doc_info, max_depth=None, anchor_style='number'):
+    """Renumber all sections and their nested headers down to max_depth levels (all by default)."""
+    anchors = header_anchors(doc_info['sections'], max_depth, anchor_style)
+    out = io.StringIO()
+    write_edits(doc_info['lines'], build_edits(doc_info, max_depth, anchors=anchors), out)
+    return out.getvalue()
 
 def print_unmatched_headers(doc_info):
     """Print information about headers that couldn't be matched."""
@@ -311,58 +502,514 @@ def print_unmatched_headers(doc_info):
         print("For sections: '# N. Title' or '## N. Title'")
         print("For subsections: '### N.M Title'")
         print("For sub-subsections: '#### N.M.K Title'")
+        print("For deeper headers: one more '#' per number, e.g. '##### N.M.K.L Title'")
 
-def main():
-    parser = argparse.ArgumentParser(description='Renumber sections and update table of contents in a Markdown file.')
-    parser.add_argument('input_file', help='Path to the input Markdown file')
-    parser.add_argument('--output', '-o', help='Path to the output file (default: input_file with _renumbered suffix)')
-    parser.add_argument('--debug', '-d', action='store_true', help='Enable debug mode to see more information')
-    args = parser.parse_args()
+def default_output_file(input_file):
+    """Return the default output path: input_file with a _renumbered suffix."""
+    name, ext = os.path.splitext(input_file)
+    return f"{name}_renumbered{ext}"
+
+def expand_inputs(patterns):
+    """Expand files, directories and glob patterns into a list of Markdown files.
     
-    # Set default output file if not specified
-    input_file = args.input_file
-    if args.output:
-        output_file = args.output
-    else:
-        name, ext = os.path.splitext(input_file)
-        output_file = f"{name}_renumbered{ext}"
+    Directories are searched recursively for *.md files, skipping outputs of
+    previous runs (files with the _renumbered suffix).
+    """
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '**', '*.md'), recursive=True))
+            matches = [m for m in matches if not os.path.splitext(m)[0].endswith('_renumbered')]
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                files.append(path)
+    return files
+
+def renumber_file(input_file, output_file, cache=None, mode='write', max_depth=None, formats=None,
+                  rewrite_refs=False, anchor_style='number'):
+    """Renumber a single file and return a small summary dict of the headers found.
     
+    mode is 'write', 'check' or 'in-place' (the last two add 'changed' and
+    'line'); the other options match the command line flags.
+    """
     # Read input file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
+    with METRICS.stage('read'):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+    METRICS.read(input_file)
     
     # Parse and process the document
-    doc_info = parse_document(content)
+    with METRICS.stage('parse'):
+        doc_info = parse_document_cached(content, cache, anchor_style)
     
-    # Print debug info
-    if args.debug or doc_info['debug']['subsection_matches'] == 0:
-        print("\nHeader pattern matching:")
-        print(f"Main section headers found: {doc_info['debug']['section_matches']}")
-        print(f"Subsection headers found: {doc_info['debug']['subsection_matches']}")
-        print(f"Sub-subsection headers found: {doc_info['debug']['subsubsection_matches']}")
+    # Keep the header-like lines among the first 20 for debug output
+    sample = []
+    for i, line in enumerate(doc_info['lines'][:20]):
+        token = lex_line(line, i)
+        if token is not None and token.spaced and token.level <= 5:
+            sample.append((i+1, line))
+    
+    rewriter = None
+    references = ()
+    if rewrite_refs:
+        rewriter = reference_rewriter(doc_info['sections'], max_depth)
+        references = reference_edits(doc_info, rewriter, input_file)
+    anchors = header_anchors(doc_info['sections'], max_depth, anchor_style)
+    
+    changed = None
+    outputs = [output_file]
+    if mode == 'write' and formats and list(formats) != ['markdown']:
+        # Every renderer consumes the same stream of renumbered lines
+        with METRICS.stage('renumber'):
+            outputs = render_document(iter_document(doc_info, max_depth, references, anchors), output_file, formats,
+                                      anchors)
+    elif mode == 'write':
+        # Stream the updated document to the output file
+        with METRICS.stage('renumber'):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                write_edits(doc_info['lines'], build_edits(doc_info, max_depth, references, anchors), f)
+        METRICS.wrote(output_file)
+    else:
+        edits = build_edits(doc_info, max_depth, references, anchors)
+        with METRICS.stage('compare'):
+            line = find_difference(content, doc_info['lines'], edits)
+        changed = line is not None
+        if changed and mode == 'in-place':
+            # Replace the file atomically so readers never see half of it
+            temp_file = output_file + '.tmp'
+            with METRICS.stage('renumber'):
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    write_edits(doc_info['lines'], edits, f)
+                os.replace(temp_file, output_file)
+            METRICS.wrote(output_file)
+    
+    # Count all sections and subsections
+    section_count, subsection_count, subsubsection_count, deeper_count = count_outline(doc_info['sections'])
+    summary = {
+        'input': input_file,
+        'output': output_file,
+        'outputs': outputs,
+        'sections': section_count,
+        'subsections': subsection_count,
+        'subsubsections': subsubsection_count,
+        'deeper': deeper_count,
+        'bytes': len(content.encode('utf-8')),
+        'debug': doc_info['debug'],
+        'sample': sample
+    }
+    if changed is not None:
+        summary['changed'] = changed
+        summary['line'] = line
+    if rewriter is not None:
+        summary['references'] = rewriter.rewritten
+        # Report lines of the input, which may still hold anchors
+        removed = removed_anchor_lines(content, anchor_style) if rewriter.unresolved else []
+        summary['unresolved'] = [(source, input_line_number(removed, line_number), reference, reason)
+                                 for source, line_number, reference, reason in rewriter.unresolved]
+    return summary
+
+def index_headers_mmap(buffer, headers=None, anchors=None, anchor_style='number'):
+    """Find headers and existing anchors in a bytes-like buffer.
+    
+    Returns (outline, header_ends, anchors) where outline is the result of
+    build_outline with byte offsets, header_ends maps header offsets to the
+    byte offset of their line end and anchors lists the byte ranges of the
+    anchors to remove. Line indexes are adjusted for the removed anchors so
+    they match parse_document. The header-like lines among the first 20 are
+    kept in outline['sample'] for debug output. headers and anchors may be
+    passed in when they were already found (see index_headers_sharded).
+    """
+    if anchors is None:
+        anchors = [match.span() for match in ANCHOR_BYTES_PATTERNS[anchor_style].finditer(buffer)]
+    if headers is None:
+        headers = iter_headers_bytes(buffer)
+    header_ends = {}
+    sample = []
+    
+    def tokens():
+        removed = 0
+        a = 0
+        for token, end in headers:
+            while a < len(anchors) and anchors[a][0] < token.offset:
+                start, stop = anchors[a]
+                removed += count_newlines(buffer, start, stop)
+                a += 1
+            header_ends[token.offset] = end
+            token = token._replace(index=token.index - removed)
+            if token.index < 20 and token.spaced and token.level <= 5:
+                sample.append((token.index + 1, token.line))
+            yield token
+    
+    outline = build_outline(tokens())
+    outline['sample'] = sample
+    return outline, header_ends, anchors
+
+def shard_ranges(buffer, shards):
+    """Cut a buffer into at most shards byte ranges of about equal size that end at line boundaries."""
+    size = len(buffer)
+    bounds = [0]
+    for i in range(1, shards):
+        cut = buffer.find(b'\n', max(size * i // shards, bounds[-1]))
+        if cut < 0 or cut + 1 >= size:
+            break
+        if cut + 1 > bounds[-1]:
+            bounds.append(cut + 1)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+def scan_shard_task(task):
+    """Process pool entry point: scan one byte range of a file for headers, fences and anchors."""
+    input_file, start, end, anchor_style = task
+    with open(input_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            items, newlines = scan_shard(mm, start, end)
+            # Anchors end with a newline, so none of them crosses a shard boundary, but
+            # a slug anchor looks ahead at its header, which may start the next shard
+            anchors = []
+            for match in ANCHOR_BYTES_PATTERNS[anchor_style].finditer(mm, start):
+                if match.start() >= end:
+                    break
+                anchors.append(match.span())
+    return items, newlines, anchors
+
+def index_headers_sharded(input_file, buffer, shards, jobs=None, anchor_style='number'):
+    """Index a memory-mapped file like index_headers_mmap, scanning shards in parallel.
+    
+    Each worker scans one line-aligned byte range. The results are stitched
+    in order: a running sum of the shards' newline counts turns shard line
+    numbers into document line numbers, and the code fence state and the
+    open sections carry over from one shard into the next, so a subsection
+    at the start of a shard still nests under the section before it.
+    """
+    tasks = [(input_file, start, end, anchor_style) for start, end in shard_ranges(buffer, shards)]
+    scans = list(map_tasks(scan_shard_task, tasks, jobs))
+    anchors = [span for items, newlines, shard_anchors in scans for span in shard_anchors]
+    headers = iter_shard_headers((items, newlines) for items, newlines, shard_anchors in scans)
+    return index_headers_mmap(buffer, headers, anchors)
+
+def write_byte_edits(buffer, edits, out):
+    """Apply ordered byte-range edits, copying the untouched ranges from buffer."""
+    position = 0
+    for start, end, replacement in edits:
+        if start < position:
+            # Anchors inside the replaced TOC are already gone
+            continue
+        out.write(buffer[position:start])
+        out.write(replacement)
+        position = end
+    out.write(buffer[position:])
+
+def renumber_file_mmap(input_file, output_file, max_depth=None, shards=None, jobs=None, anchor_style='number'):
+    """Renumber a file through a memory map without decoding its body.
+    
+    Header offsets come from a bytes-level scan, and the output is written as
+    the unchanged byte ranges between edits plus the rewritten TOC and header
+    lines. With shards, the scan is split over that many byte ranges scanned
+    by up to jobs processes. Produces the same result as renumber_file;
+    files with CRLF line ends are handed to renumber_file, which reads them
+    with universal newlines, since copying their bytes would mix line ends.
+    """
+    with open(input_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            # Empty files cannot be memory-mapped
+            return renumber_file(input_file, output_file, max_depth=max_depth, anchor_style=anchor_style)
         
-        # Check first 20 lines to see formats
-        print("\nSample of document lines (first 20):")
-        for i, line in enumerate(doc_info['lines'][:20]):
-            if re.match(r'^#{1,5}\s+', line):
-                print(f"Line {i+1}: {line}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Copied CRLF lines would mix with the LF of the rewritten ones
+            if mm.find(b'\r\n') >= 0:
+                return renumber_file(input_file, output_file, max_depth=max_depth, anchor_style=anchor_style)
+            
+            METRICS.read(input_file)
+            with METRICS.stage('index'):
+                if shards and shards > 1:
+                    outline, header_ends, anchors = index_headers_sharded(input_file, mm, shards, jobs, anchor_style)
+                else:
+                    outline, header_ends, anchors = index_headers_mmap(mm, anchor_style=anchor_style)
+            METRICS.match('anchor', len(anchors))
+            sections = outline['sections']
+            anchor_ids = header_anchors(sections, max_depth, anchor_style)
+            
+            # Edits replace byte ranges; old anchors are removed
+            edits = [Edit(start, end, b'') for start, end in anchors]
+            
+            toc_start = outline['toc_start']
+            toc_end = outline['toc_end']
+            if toc_start is not None and (toc_end is not None or header_ends[toc_start.offset] < size):
+                new_toc = '\n'.join(generate_toc(sections, max_depth, anchor_ids))
+                if toc_end is not None:
+                    edits.append(Edit(toc_start.offset, toc_end.offset, (new_toc + '\n').encode('utf-8')))
+                else:
+                    edits.append(Edit(toc_start.offset, size, new_toc.encode('utf-8')))
+            
+            for header, path in iter_numbered_headers(sections, max_depth):
+                start = header.offset
+                edits.append(Edit(start, start, (anchor_line(path, anchor_ids) + '\n').encode('utf-8')))
+                edits.append(Edit(start, header_ends[start], renumber_header_line(header, path).encode('utf-8')))
+            edits.sort()
+            
+            # Copy the bytes between edits straight from the map; the output may
+            # be the input, so it only replaces the target once the map is closed
+            temp_file = output_file + '.tmp'
+            with METRICS.stage('renumber'):
+                with open(temp_file, 'wb') as out, memoryview(mm) as view:
+                    write_byte_edits(view, edits, out)
+    os.replace(temp_file, output_file)
+    METRICS.wrote(output_file)
+    
+    section_count, subsection_count, subsubsection_count, deeper_count = count_outline(sections)
+    return {
+        'input': input_file,
+        'output': output_file,
+        'sections': section_count,
+        'subsections': subsection_count,
+        'subsubsections': subsubsection_count,
+        'deeper': deeper_count,
+        'bytes': size,
+        'debug': outline['debug'],
+        'sample': outline['sample']
+    }
+
+def renumber_file_task(task):
+    """Process pool entry point: renumber one file, reporting errors instead of raising.
+    
+    With collect_metrics the file's own metrics are attached to the summary
+    so that the parent process can add them up.
+    """
+    input_file, output_file, use_mmap, collect_metrics, cache, mode, max_depth, formats, rewrite_refs, anchor_style = task
+    if collect_metrics:
+        METRICS.reset()
+        METRICS.enable()
+    try:
+        if use_mmap:
+            summary = renumber_file_mmap(input_file, output_file, max_depth, anchor_style=anchor_style)
+        else:
+            summary = renumber_file(input_file, output_file, cache, mode, max_depth, formats, rewrite_refs, anchor_style)
+    except (OSError, UnicodeDecodeError) as e:
+        summary = {'input': input_file, 'output': output_file, 'error': str(e)}
+    if collect_metrics:
+        summary['metrics'] = METRICS.report()
+    return summary
+
+def print_debug_info(summary):
+    """Print header matching statistics for a renumbered file."""
+    print("\nHeader pattern matching:")
+    print(f"Main section headers found: {summary['debug']['section_matches']}")
+    print(f"Subsection headers found: {summary['debug']['subsection_matches']}")
+    print(f"Sub-subsection headers found: {summary['debug']['subsubsection_matches']}")
+    print(f"Deeper headers found: {summary['debug']['deeper_matches']}")
+    
+    # Check first 20 lines to see formats
+    print("\nSample of document lines (first 20):")
+    for line_num, line in summary['sample']:
+        print(f"Line {line_num}: {line}")
+    
+    print_unmatched_headers(summary)
+
+def map_tasks(function, tasks, jobs=None):
+    """Yield function(task) for each task in order, on a process pool unless jobs is 1."""
+    if jobs == 1:
+        yield from map(function, tasks)
+        return
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        yield from pool.map(function, tasks)
+    finally:
+        # A caller that stops early does not wait for the remaining tasks
+        pool.shutdown(cancel_futures=True)
+
+def renumber_batch(files, jobs=None, debug=False, use_mmap=False, cache=None, mode='write', max_depth=None,
+                   formats=None, rewrite_refs=False, anchor_style='number'):
+    """Renumber many files across a process pool and print a report.
+    
+    In 'check' mode the run stops at the first file that would change.
+    Returns the number of files that failed (or need renumbering).
+    """
+    if mode != 'write':
+        return check_batch(files, jobs, cache, mode, max_depth, rewrite_refs, anchor_style)
+    
+    start_time = time.perf_counter()
+    # Worker processes collect their own metrics when the parent does
+    collect_metrics = METRICS.enabled and jobs != 1
+    tasks = [(input_file, default_output_file(input_file), use_mmap, collect_metrics, cache, mode, max_depth, formats,
+              rewrite_refs, anchor_style)
+             for input_file in files]
+    
+    totals = {'sections': 0, 'subsections': 0, 'subsubsections': 0, 'deeper': 0, 'bytes': 0}
+    failed = 0
+    
+    # Results arrive in input order, so the report is deterministic
+    for summary in map_tasks(renumber_file_task, tasks, jobs):
+        if collect_metrics:
+            METRICS.merge(summary.pop('metrics'))
+        if 'error' in summary:
+            failed += 1
+            print(f"FAILED {summary['input']}: {summary['error']}")
+            continue
         
-        print_unmatched_headers(doc_info)
+        print(f"{summary['input']} -> {', '.join(summary.get('outputs', [summary['output']]))}: {summary['sections']} sections, "
+              f"{summary['subsections']} subsections, {summary['subsubsections']} sub-subsections"
+              + (f", {summary['deeper']} deeper headers" if summary['deeper'] else ''))
+        if rewrite_refs:
+            print_unresolved(summary['unresolved'])
+        if debug:
+            print_debug_info(summary)
+        for key in totals:
+            totals[key] += summary[key]
     
-    # Update the document
-    updated_content = renumber_document(doc_info)
+    elapsed = time.perf_counter() - start_time
+    print(f"\nRenumbered {len(files) - failed} of {len(files)} files in {elapsed:.2f}s "
+          f"({totals['bytes'] / 1024:.1f} KiB)")
+    print(f"Total: {totals['sections']} sections, {totals['subsections']} subsections, "
+          f"and {totals['subsubsections']} sub-subsections"
+          + (f" ({totals['deeper']} deeper headers)" if totals['deeper'] else ''))
+    if failed:
+        print(f"{failed} files failed")
+    return failed
+
+def check_batch(files, jobs=None, cache=None, mode='check', max_depth=None, rewrite_refs=False, anchor_style='number'):
+    """Check or update in place many files, printing one line per file.
     
-    # Write output file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(updated_content)
+    Returns the number of files that failed; in 'check' mode a file that
+    would change counts as failed and ends the run.
+    """
+    start_time = time.perf_counter()
+    collect_metrics = METRICS.enabled and jobs != 1
+    tasks = [(input_file, input_file, False, collect_metrics, cache, mode, max_depth, None, rewrite_refs, anchor_style)
+             for input_file in files]
     
-    print(f"\nSuccessfully renumbered sections in {input_file}")
-    print(f"Updated document saved to {output_file}")
+    failed = 0
+    changed = 0
+    done = 0
+    for summary in map_tasks(renumber_file_task, tasks, jobs):
+        done += 1
+        if collect_metrics:
+            METRICS.merge(summary.pop('metrics'))
+        if 'error' in summary:
+            failed += 1
+            print(f"FAILED {summary['input']}: {summary['error']}")
+            continue
+        if rewrite_refs:
+            print_unresolved(summary['unresolved'])
+        if summary['changed']:
+            changed += 1
+            if mode == 'check':
+                failed += 1
+                print(f"{summary['input']}:{summary['line']}: differs from the renumbered document")
+                break
+            print(f"Rewrote {summary['input']}")
     
-    # Count all sections and subsections
-    subsection_count = sum(len(s['subsections']) for s in doc_info['sections'])
-    subsubsection_count = sum(sum(len(ss.get('subsubsections', [])) for ss in s['subsections']) for s in doc_info['sections'])
-    print(f"Found {len(doc_info['sections'])} sections, {subsection_count} subsections, and {subsubsection_count} sub-subsections")
+    elapsed = time.perf_counter() - start_time
+    if mode == 'check':
+        print(f"\nChecked {done} of {len(files)} files in {elapsed:.2f}s")
+    else:
+        print(f"\nRewrote {changed} of {len(files)} files in {elapsed:.2f}s, {done - changed - failed} already up to date")
+    if failed:
+        print(f"{failed} files failed" if mode != 'check' else "Run renumber_tutorial.py --in-place to fix")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Renumber sections and update table of contents in Markdown files.')
+    parser.add_argument('inputs', nargs='+', metavar='input_file',
+                        help='Markdown files, directories (searched recursively) or glob patterns')
+    parser.add_argument('--output', '-o', help='Path to the output file (default: input_file with _renumbered suffix)')
+    parser.add_argument('--debug', '-d', action='store_true', help='Enable debug mode to see more information')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='Worker processes for multiple files (default: number of CPUs)')
+    parser.add_argument('--mmap', action='store_true',
+                        help='Memory-map the input and copy body bytes unchanged (for very large files)')
+    parser.add_argument('--shards', type=int, default=None,
+                        help='Scan a single large file as this many byte ranges in parallel (implies --mmap)')
+    parser.add_argument('--check', action='store_true',
+                        help='Only verify that files are already renumbered; exit 1 at the first one that is not')
+    parser.add_argument('--in-place', '-i', action='store_true',
+                        help='Renumber files in place, rewriting only those that change')
+    parser.add_argument('--format', '-f', action='append', choices=FORMATS, dest='formats',
+                        help='Output format; repeat to write several from one parse: markdown (default), '
+                             'html (one fragment per section in <output>_html/) or json (outline in <output>.outline.json)')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='Renumber, anchor and list in the TOC only headers down to this depth (default: all)')
+    parser.add_argument('--rewrite-refs', action='store_true',
+                        help='Also renumber references such as "раздел 5.2", "section 3.1" and (#section-4-2) in the text')
+    parser.add_argument('--anchors', choices=ANCHOR_STYLES, default='number',
+                        help='Header anchors: number (section-4-2, the default) or slug (transliterated title, '
+                             'stable across renumbering); old slug anchors are only replaced in slug mode')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help=f'Directory for cached parse results (default: {CACHE_DIR})')
+    parser.add_argument('--cache-size', type=float, default=64,
+                        help='Maximum size of the parse cache in MiB (default: 64)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always parse documents instead of using the parse cache')
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    
+    with instrumented(args, 'renumber_tutorial'):
+        run(args, parser)
+
+def run(args, parser):
+    """Renumber the files named by the parsed command line arguments."""
+    files = expand_inputs(args.inputs)
+    if not files:
+        parser.error('no Markdown files matched the given inputs')
+    if args.output and len(files) > 1:
+        parser.error('--output can only be used with a single input file')
+    if args.check and args.in_place:
+        parser.error('--check and --in-place cannot be combined')
+    if (args.check or args.in_place) and (args.output or args.mmap):
+        parser.error('--check and --in-place work on the input files without --output or --mmap')
+    if args.shards is not None:
+        if args.shards < 1:
+            parser.error('--shards must be at least 1')
+        if len(files) > 1:
+            parser.error('--shards splits a single input file; use --jobs for several files')
+        args.mmap = True
+    if args.rewrite_refs and args.mmap:
+        parser.error('--rewrite-refs needs the decoded text and cannot be combined with --mmap or --shards')
+    if args.formats and (args.check or args.in_place or args.mmap):
+        parser.error('--format cannot be combined with --check, --in-place or --mmap')
+    if args.max_depth is not None and args.max_depth < 1:
+        parser.error('--max-depth must be at least 1')
+    mode = 'check' if args.check else 'in-place' if args.in_place else 'write'
+    
+    # The cache holds text-mode parse results; --mmap never builds them
+    cache = None
+    if not args.no_cache and not args.mmap:
+        cache = DocumentCache(args.cache_dir, int(args.cache_size * 2**20))
+    
+    if len(files) > 1 or mode != 'write':
+        failed = renumber_batch(files, args.jobs, args.debug, args.mmap, cache, mode, args.max_depth, args.formats,
+                                args.rewrite_refs, args.anchors)
+        sys.exit(1 if failed else 0)
+    
+    # Set default output file if not specified
+    input_file = files[0]
+    output_file = args.output or default_output_file(input_file)
+    
+    if args.mmap:
+        summary = renumber_file_mmap(input_file, output_file, args.max_depth, args.shards, args.jobs, args.anchors)
+    else:
+        summary = renumber_file(input_file, output_file, cache, max_depth=args.max_depth, formats=args.formats,
+                                rewrite_refs=args.rewrite_refs, anchor_style=args.anchors)
+    
+    # Print debug info
+    if args.debug or summary['debug']['subsection_matches'] == 0:
+        print_debug_info(summary)
+    
+    print(f"\nSuccessfully renumbered sections in {input_file}")
+    print(f"Updated document saved to {', '.join(summary.get('outputs', [output_file]))}")
+    print(f"Found {summary['sections']} sections, {summary['subsections']} subsections, and {summary['subsubsections']} sub-subsections")
+    if summary['deeper']:
+        print(f"Found {summary['deeper']} deeper headers")
+    if args.rewrite_refs:
+        print(f"Rewrote {summary['references']} references")
+        print_unresolved(summary['unresolved'])
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
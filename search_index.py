@@ -0,0 +1,218 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import heapq
+import hashlib
+import argparse
+from collections import Counter
+
+from renumber_tutorial import anchor_id, expand_inputs, iter_numbered_headers, parse_document
+
+INDEX_FILE = '.search_index.json'
+
+# Bump whenever tokenization or the stored format changes
+INDEX_VERSION = 2
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Lowercase Cyrillic ё is folded into е so "ещё" finds "еще"
+FOLD_TABLE = str.maketrans({'ё': 'е'})
+
+# Title words count this many times as often as body words
+TITLE_WEIGHT = 3
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+def normalize_terms(text):
+    """Split text into lowercased terms with ё folded into е."""
+    return WORD_PATTERN.findall(text.lower().translate(FOLD_TABLE))
+
+def iter_units(doc_info):
+    """Yield (anchor, title, text) for every numbered header of a parsed document.
+
+    A unit is the header line and the lines up to the next numbered header,
+    so subsections are separate units from their section.
+    """
+    lines = doc_info['lines']
+    headers = list(iter_numbered_headers(doc_info['sections']))
+    for i, (header, path) in enumerate(headers):
+        end = headers[i + 1][0].index if i + 1 < len(headers) else len(lines)
+        yield anchor_id(path), header.title, '\n'.join(lines[header.index:end])
+
+class SearchIndex:
+    """Persistent inverted index from terms to tutorial sections.
+
+    Units (sections, subsections and sub-subsections) are identified as
+    "file#anchor". Every unit keeps its term frequencies and a digest of
+    its text, so updating a changed file only re-tokenizes the units whose
+    text changed. Postings are rebuilt from the units when the index is
+    loaded and answer queries from memory.
+    """
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.files = {}
+        self.units = {}
+        self.postings = {}
+        self.total_length = 0
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.files = data['files']
+                for unit_id, unit in data['units'].items():
+                    self.add_unit(unit_id, unit)
+
+    def add_unit(self, unit_id, unit):
+        self.units[unit_id] = unit
+        self.total_length += unit['length']
+        for term, frequency in unit['terms'].items():
+            self.postings.setdefault(term, {})[unit_id] = frequency
+
+    def remove_unit(self, unit_id):
+        unit = self.units.pop(unit_id)
+        self.total_length -= unit['length']
+        for term in unit['terms']:
+            postings = self.postings[term]
+            del postings[unit_id]
+            if not postings:
+                del self.postings[term]
+
+    def update_file(self, path):
+        """Index a Markdown file, re-tokenizing only units that changed.
+
+        Returns the number of units (re)indexed, 0 if the file is unchanged.
+        """
+        key = os.path.normpath(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if self.files.get(key, {}).get('signature') == signature:
+            return 0
+
+        with open(path, 'r', encoding='utf-8') as f:
+            doc_info = parse_document(f.read())
+
+        old_ids = set(self.files.get(key, {}).get('units', []))
+        unit_ids = []
+        changed = 0
+        for anchor, title, text in iter_units(doc_info):
+            unit_id = f'{key}#{anchor}'
+            unit_ids.append(unit_id)
+            digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            unit = self.units.get(unit_id)
+            if unit is not None and unit['digest'] == digest:
+                continue
+            if unit is not None:
+                self.remove_unit(unit_id)
+
+            body_terms = normalize_terms(text)
+            terms = Counter(body_terms)
+            for term in normalize_terms(title):
+                terms[term] += TITLE_WEIGHT - 1
+            self.add_unit(unit_id, {
+                'file': key,
+                'anchor': anchor,
+                'title': title,
+                'digest': digest,
+                'length': len(body_terms),
+                'terms': dict(terms)
+            })
+            changed += 1
+
+        for unit_id in old_ids.difference(unit_ids):
+            self.remove_unit(unit_id)
+        self.files[key] = {'signature': signature, 'units': unit_ids}
+        return changed
+
+    def remove_file(self, key):
+        """Drop a file and its units from the index."""
+        for unit_id in self.files.pop(key)['units']:
+            self.remove_unit(unit_id)
+
+    def prune(self):
+        """Drop files that no longer exist; returns their paths."""
+        missing = [key for key in self.files if not os.path.exists(key)]
+        for key in missing:
+            self.remove_file(key)
+        return missing
+
+    def search(self, query, limit=10):
+        """Return up to limit units matching query, best BM25 score first.
+
+        Each result is a dict with id, file, anchor, title and score.
+        """
+        if not self.units:
+            return []
+        average_length = self.total_length / len(self.units) or 1
+        scores = {}
+        for term in set(normalize_terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.units) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for unit_id, frequency in postings.items():
+                length = self.units[unit_id]['length']
+                norm = K1 * (1 - B + B * length / average_length)
+                scores[unit_id] = scores.get(unit_id, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        results = []
+        for unit_id, score in best:
+            unit = self.units[unit_id]
+            results.append({'id': unit_id, 'file': unit['file'], 'anchor': unit['anchor'],
+                            'title': unit['title'], 'score': score})
+        return results
+
+    def save(self):
+        """Write the index back to disk."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self.files, 'units': self.units},
+                      f, ensure_ascii=False, separators=(',', ':'))
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search over tutorial sections.')
+    parser.add_argument('--index', default=INDEX_FILE, help=f'Index file (default: {INDEX_FILE})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = commands.add_parser('update', help='Index new and changed Markdown files')
+    update_parser.add_argument('inputs', nargs='+', metavar='input_file',
+                               help='Markdown files, directories (searched recursively) or glob patterns')
+
+    query_parser = commands.add_parser('query', help='Search the indexed sections')
+    query_parser.add_argument('text', nargs='+', help='Search terms')
+    query_parser.add_argument('--limit', '-n', type=int, default=10, help='Maximum number of results (default: 10)')
+    args = parser.parse_args()
+
+    index = SearchIndex(args.index)
+
+    if args.command == 'update':
+        files = expand_inputs(args.inputs)
+        if not files:
+            parser.error('no Markdown files matched the given inputs')
+        for key in index.prune():
+            print(f"Removed {key}")
+        for path in files:
+            changed = index.update_file(path)
+            if changed:
+                print(f"Indexed {changed} sections of {path}")
+        index.save()
+        print(f"Index has {len(index.units)} sections from {len(index.files)} files")
+        return
+
+    start_time = time.perf_counter()
+    results = index.search(' '.join(args.text), args.limit)
+    elapsed = (time.perf_counter() - start_time) * 1000
+    if not results:
+        print("No matches")
+        sys.exit(1)
+    for result in results:
+        print(f"{result['score']:6.2f}  {result['id']}  {result['title']}")
+    print(f"\n{len(results)} results in {elapsed:.3f} ms")
+
+if __name__ == "__main__":
+    main()
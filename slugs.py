@@ -0,0 +1,71 @@
+import re
+import string
+import unicodedata
+from functools import lru_cache
+
+# Anchor styles: section-4-2 from the number, or a slug of the title
+ANCHOR_STYLES = ('number', 'slug')
+
+# Lowercase Cyrillic (Russian and Ukrainian) to Latin, roughly as in
+# passports and on GitHub wikis
+CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'і': 'i', 'ї': 'yi', 'є': 'ye', 'ґ': 'g',
+}
+
+# One table transliterates Cyrillic, deletes ASCII punctuation and turns
+# whitespace and underscores into the separator
+SLUG_TABLE = str.maketrans({
+    **CYRILLIC,
+    **{c: None for c in string.punctuation if c not in '-_'},
+    **{c: '-' for c in string.whitespace + '_'},
+})
+
+# Runs of separators left by spaces and deleted characters
+SEPARATOR_PATTERN = re.compile(r'-{2,}')
+
+@lru_cache(maxsize=4096)
+def slugify(text):
+    """Convert text to a lowercase ASCII slug for URLs and anchors.
+
+    Cyrillic is transliterated ("Настройка" -> "nastroyka"), accents are
+    dropped from other letters and anything else that is not a letter,
+    digit or hyphen is removed. A slug of digits only gets a "section-"
+    prefix. Results are memoized, since the same titles come up in the TOC,
+    the anchors and across runs over the same documents.
+    """
+    slug = text.lower().translate(SLUG_TABLE)
+    if not slug.isascii():
+        # Accents become combining marks, which are dropped with the other non-ASCII characters
+        slug = unicodedata.normalize('NFKD', slug).encode('ascii', 'ignore').decode('ascii')
+    slug = SEPARATOR_PATTERN.sub('-', slug).strip('-')
+    if slug.isdigit():
+        slug = f'section-{slug}'
+    return slug
+
+class SlugRegistry:
+    """Hand out unique anchors within one document.
+
+    Like GitHub, the first use of a slug keeps it and later uses get -1,
+    -2 and so on, skipping suffixed slugs that are already taken.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def unique(self, slug):
+        count = self.counts.get(slug)
+        if count is None:
+            self.counts[slug] = 0
+            return slug
+        while True:
+            count += 1
+            candidate = f'{slug}-{count}'
+            if candidate not in self.counts:
+                self.counts[slug] = count
+                self.counts[candidate] = 0
+                return candidate
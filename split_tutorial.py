@@ -1,30 +1,36 @@
 import os
-import re
 import json
+import argparse
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from build_manifest import BuildManifest, combined_hash, config_hash, content_hash
+from instrumentation import METRICS, add_instrumentation_arguments, instrumented
+from header_lexer import HeaderLexer, is_section_header, iter_headers, renumber_header
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
 def extract_sections(content):
-    # Pattern to match section headers (both ## N. and # N.)
-    section_pattern = r'^#{1,2}\s+(\d+)\.\s+'
-    
     lines = content.split('\n')
     sections = {}
     current_section = None
     current_content = []
+    lexer = HeaderLexer()
     
     for line in lines:
-        # Check if this is a section header
-        match = re.match(section_pattern, line)
-        if match:
+        # Check if this is a section header (both ## N. and # N.)
+        token = lexer.feed(line)
+        if token is not None and is_section_header(token):
             # If we were collecting a section, save it
             if current_section is not None:
                 sections[current_section] = '\n'.join(current_content)
             
             # Start new section
-            current_section = int(match.group(1))
+            current_section = token.numbers[0]
             current_content = [line]
         elif current_section is not None:
             current_content.append(line)
@@ -33,52 +39,277 @@ def extract_sections(content):
     if current_section is not None and current_content:
         sections[current_section] = '\n'.join(current_content)
     
+    METRICS.count('lines_scanned', lexer.index)
+    METRICS.match('section', len(sections))
     return sections
 
 def renumber_section_content(content, new_number):
     """Renumber a section's content with a new section number."""
-    # Pattern to match section headers (both ## N. and # N.)
-    section_pattern = r'^(#{1,2})\s+\d+\.'
-    
     lines = content.split('\n')
-    new_lines = []
     
-    for line in lines:
-        # Check if this is a section header
-        match = re.match(section_pattern, line)
-        if match:
-            # Replace the old number with the new one
-            hashes = match.group(1)
-            new_line = re.sub(r'^#{1,2}\s+\d+\.', f'{hashes} {new_number}.', line)
-            new_lines.append(new_line)
-        else:
-            # Also update any subsection references like "### 1.1" to match new number
-            subsection_match = re.match(r'^(#{3,})\s+\d+\.(\d+)', line)
-            if subsection_match:
-                hashes = subsection_match.group(1)
-                subsection = subsection_match.group(2)
-                new_line = re.sub(r'^#{3,}\s+\d+\.\d+', f'{hashes} {new_number}.{subsection}', line)
-                new_lines.append(new_line)
-            else:
-                new_lines.append(line)
-    
-    return '\n'.join(new_lines)
-
-def save_section_file(section_num, content, output_dir, new_number=None):
-    """Save a section to an individual file with optional renumbering."""
+    # Replace the section number in "## N." headers and the leading
+    # component of subsection headers like "### N.M"
+    for token in iter_headers(lines):
+        new_line = renumber_header(token, new_number)
+        if new_line is not None:
+            lines[token.index] = new_line
+    
+    return '\n'.join(lines)
+
+def section_filename(section_num):
+    """Return the file name used for a section number."""
+    return f'section_{str(section_num).zfill(2)}.md'
+
+def save_section_file(section_num, content, output_dir, new_number=None, manifest=None):
+    """Save a section to an individual file with optional renumbering.
+    
+    With a manifest the file is only rewritten when its content changed.
+    """
     if new_number is not None:
         content = renumber_section_content(content, new_number)
-        filename = f'section_{str(new_number).zfill(2)}.md'
+        filename = section_filename(new_number)
     else:
-        filename = f'section_{str(section_num).zfill(2)}.md'
+        filename = section_filename(section_num)
     
     filepath = os.path.join(output_dir, filename)
     
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(content)
+    if manifest is not None:
+        if manifest.write_if_changed(filepath, content):
+            METRICS.wrote(filepath)
+    else:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(content)
+        METRICS.wrote(filepath)
     
     return filename
 
+class SectionWriter:
+    """Write a section file piece by piece.
+    
+    With a manifest the content goes to a temporary file and replaces the
+    real one only if its hash differs from the recorded one, so unchanged
+    sections keep their mtime.
+    """
+    
+    def __init__(self, filepath, manifest=None):
+        self.filepath = filepath
+        self.manifest = manifest
+        if manifest is not None:
+            self.hasher = hashlib.sha256()
+            self.file = open(filepath + '.tmp', 'w', encoding='utf-8')
+        else:
+            self.hasher = None
+            self.file = open(filepath, 'w', encoding='utf-8')
+    
+    def write(self, text):
+        self.file.write(text)
+        if self.hasher is not None:
+            self.hasher.update(text.encode('utf-8'))
+    
+    def abort(self):
+        """Close and remove the file being written, keeping the real one when writing through a temporary file."""
+        self.file.close()
+        os.remove(self.file.name)
+    
+    def close(self):
+        self.file.close()
+        if self.manifest is None:
+            METRICS.wrote(self.filepath)
+            return
+        
+        temp_path = self.filepath + '.tmp'
+        digest = self.hasher.hexdigest()
+        if self.manifest.is_current(self.filepath, digest):
+            os.remove(temp_path)
+            self.manifest.skip()
+        else:
+            os.replace(temp_path, self.filepath)
+            self.manifest.record(self.filepath, digest)
+            self.manifest.record_file(self.filepath, digest)
+            METRICS.wrote(self.filepath)
+
+def split_stream(input_file, output_dir, manifest=None):
+    """Split a tutorial into section files without loading it into memory.
+    
+    The input is read line by line, so memory use does not grow with the
+    size of the document, and the result matches extract_sections followed
+    by save_sections. While section numbers keep increasing every section
+    goes straight to its final file; if a number repeats or goes down, the
+    input is split again through temporary files. Returns a dict mapping
+    original section numbers to written filenames, in output order.
+    """
+    written = split_stream_in_order(input_file, output_dir, manifest)
+    if written is None:
+        written = split_stream_parts(input_file, output_dir, manifest)
+    for old_num, filename in written.items():
+        print(f"Created section file: {filename} (original section {old_num})")
+    return written
+
+def split_stream_in_order(input_file, output_dir, manifest=None):
+    """Write every section renumbered to its section file as soon as it is read.
+    
+    Returns the written filenames by original number, or None as soon as a
+    section number is not higher than the one before it.
+    """
+    written = {}
+    out = None
+    new_num = 0
+    ends_with_newline = False
+    lexer = HeaderLexer()
+    
+    try:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                ends_with_newline = line.endswith('\n')
+                if ends_with_newline:
+                    line = line[:-1]
+                
+                token = lexer.feed(line)
+                if token is not None and is_section_header(token):
+                    if written and token.numbers[0] <= old_num:
+                        return None
+                    if out is not None:
+                        out.close()
+                        out = None
+                    old_num = token.numbers[0]
+                    new_num += 1
+                    written[old_num] = section_filename(new_num)
+                    out = SectionWriter(os.path.join(output_dir, written[old_num]), manifest)
+                    out.write(renumber_header(token, new_num))
+                    continue
+                
+                # Skip the preamble before the first section
+                if out is None:
+                    continue
+                
+                # Lines are joined with '\n' exactly like extract_sections does
+                if token is not None:
+                    line = renumber_header(token, new_num) or line
+                out.write('\n')
+                out.write(line)
+        
+        if out is not None:
+            if ends_with_newline:
+                out.write('\n')
+            out.close()
+            out = None
+    finally:
+        if out is not None:
+            out.abort()
+    
+    METRICS.read(input_file)
+    METRICS.count('lines_scanned', lexer.index)
+    METRICS.match('section', len(written))
+    return written
+
+def split_stream_parts(input_file, output_dir, manifest=None):
+    """Split through temporary files, for inputs whose section numbers repeat or go down.
+    
+    Every section is written to a temporary file named after its original
+    number, so a later section with the same number replaces an earlier
+    one. The temporary files are then copied to section files numbered in
+    order of original numbers and removed, also when this fails.
+    """
+    parts = {}
+    out = None
+    ends_with_newline = False
+    lexer = HeaderLexer()
+    
+    try:
+        try:
+            with open(input_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    ends_with_newline = line.endswith('\n')
+                    if ends_with_newline:
+                        line = line[:-1]
+                    
+                    token = lexer.feed(line)
+                    if token is not None and is_section_header(token):
+                        # Close the previous section and start its file, replacing a duplicate
+                        if out is not None:
+                            out.close()
+                        part_path = os.path.join(output_dir, f'.{section_filename(token.numbers[0])}.part')
+                        parts[token.numbers[0]] = part_path
+                        out = open(part_path, 'w', encoding='utf-8')
+                        out.write(line)
+                        continue
+                    
+                    # Skip the preamble before the first section
+                    if out is None:
+                        continue
+                    
+                    # Lines are joined with '\n' exactly like extract_sections does
+                    out.write('\n')
+                    out.write(line)
+            
+            if out is not None and ends_with_newline:
+                out.write('\n')
+        finally:
+            if out is not None:
+                out.close()
+        
+        METRICS.read(input_file)
+        METRICS.count('lines_scanned', lexer.index)
+        METRICS.match('section', len(parts))
+        
+        written = {}
+        for new_num, old_num in enumerate(sorted(parts), 1):
+            written[old_num] = section_filename(new_num)
+            copy_renumbered_part(parts[old_num], os.path.join(output_dir, written[old_num]), new_num, manifest)
+        return written
+    finally:
+        for part_path in parts.values():
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+def copy_renumbered_part(part_path, filepath, new_num, manifest=None):
+    """Copy a temporary section file of split_stream_parts to filepath renumbered as new_num."""
+    lexer = HeaderLexer()
+    out = SectionWriter(filepath, manifest)
+    try:
+        with open(part_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                token = lexer.feed(line)
+                if token is not None:
+                    new_line = renumber_header(token, new_num)
+                    if new_line is not None:
+                        line = new_line + '\n' if line.endswith('\n') else new_line
+                out.write(line)
+    except BaseException:
+        out.abort()
+        raise
+    out.close()
+
+class SectionFiles:
+    """Read-on-demand mapping of original section numbers to section files.
+    
+    Lets create_section_groups work from files written by split_stream
+    while holding only one section in memory at a time.
+    """
+    
+    def __init__(self, written, output_dir, manifest=None):
+        self.written = written
+        self.output_dir = output_dir
+        self.manifest = manifest
+    
+    def __contains__(self, section_num):
+        return section_num in self.written
+    
+    def __getitem__(self, section_num):
+        filepath = os.path.join(self.output_dir, self.written[section_num])
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    def keys(self):
+        return self.written.keys()
+    
+    def digest(self, section_num):
+        """Content hash of a section file, cached by the manifest when available."""
+        filepath = os.path.join(self.output_dir, self.written[section_num])
+        if self.manifest is not None:
+            return self.manifest.file_digest(filepath)
+        return content_hash(self[section_num])
+
 def load_section_groups(config_file='section_groups.json'):
     """Load section grouping configuration from a JSON file."""
     if os.path.exists(config_file):
@@ -86,50 +317,212 @@ def load_section_groups(config_file='section_groups.json'):
             return json.load(f)
     return None
 
-def create_section_groups(sections, section_groups, output_dir):
-    """Create grouped files based on configuration with sequential numbering within groups."""
-    if not section_groups:
-        return
+def section_digest(sections, section_num):
+    """Content hash of a section held in memory or in a SectionFiles view."""
+    if isinstance(sections, SectionFiles):
+        return sections.digest(section_num)
+    return content_hash(sections[section_num])
+
+class Renderings:
+    """Memoize renumbered sections that several groups need.
+    
+    uses counts how often each (original number, new number) key occurs
+    across groups; only keys that occur more than once are kept, and each
+    is dropped after its last use, so the memo never holds more than the
+    shared sections still to be written. Safe to share between threads.
+    """
+    
+    def __init__(self, uses):
+        self.uses = {key: count for key, count in uses.items() if count > 1}
+        self.contents = {}
+        self.lock = threading.Lock()
+    
+    def get(self, key, render):
+        """Return the content for key, calling render() only on its first use.
         
-    for group_name, group_info in section_groups.items():
-        content = [group_info.get('header', f'# {group_name}\n\n')]
-        section_list = group_info.get('sections', [])
+        Unshared keys are rendered without the lock. A shared key is rendered
+        by its first user while later users wait on its Future, so the lock
+        is only held for the lookup.
+        """
+        with self.lock:
+            shared = key in self.uses
+            if shared:
+                future = self.contents.get(key)
+                first = future is None
+                if first:
+                    future = self.contents[key] = Future()
+                self.done(key)
+        if not shared:
+            return render()
+        if first:
+            try:
+                future.set_result(render())
+            except BaseException as error:
+                future.set_exception(error)
+                raise
+        return future.result()
+    
+    def done(self, key):
+        """Count one use of key, dropping its Future after the last one (call with the lock held)."""
+        if key in self.uses:
+            self.uses[key] -= 1
+            if not self.uses[key]:
+                del self.uses[key]
+                self.contents.pop(key, None)
+    
+    def skip(self, keys):
+        """Count the uses of a group that is not written."""
+        with self.lock:
+            for key in keys:
+                self.done(key)
+
+def write_section_group(sections, group_name, group_info, output_dir, manifest=None, renderings=None):
+    """Write one group file with its sections renumbered from 1.
+    
+    renderings, if given, is a Renderings memo shared across groups.
+    """
+    section_list = group_info.get('sections', [])
+    output_file = os.path.join(output_dir, f'{group_name}.md')
+    
+    if manifest is not None:
+        # The group is built from its config entry and its member sections
+        group_key = combined_hash(group_name, config_hash(group_info), *[
+            section_digest(sections, old_num) if old_num in sections else ''
+            for old_num in section_list
+        ])
+        if manifest.is_current(output_file, group_key):
+            manifest.skip()
+            if renderings is not None:
+                renderings.skip((old_num, new_num) for new_num, old_num in enumerate(section_list, 1))
+            return output_file
+    
+    # Write the group file one section at a time
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(group_info.get('header', f'# {group_name}\n\n'))
         
         # Add sections with renumbered content
         for new_num, old_num in enumerate(section_list, 1):
             if old_num in sections:
-                section_content = renumber_section_content(sections[old_num], new_num)
-                content.append(section_content)
-        
-        # Write the group file
-        output_file = os.path.join(output_dir, f'{group_name}.md')
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(content))
+                if renderings is not None:
+                    content = renderings.get((old_num, new_num),
+                                             lambda: renumber_section_content(sections[old_num], new_num))
+                else:
+                    content = renumber_section_content(sections[old_num], new_num)
+                f.write('\n')
+                f.write(content)
+    
+    if manifest is not None:
+        manifest.record(output_file, group_key)
+    METRICS.wrote(output_file)
+    return output_file
+
+def run_tasks(function, tasks, jobs=1):
+    """Apply function to each task tuple, on a thread pool when jobs > 1.
+    
+    Results come back in task order, so output stays deterministic.
+    """
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(lambda task: function(*task), tasks))
+    return [function(*task) for task in tasks]
+
+def save_sections(sections, output_dir, manifest=None, jobs=1):
+    """Renumber and save sections sequentially in order of their original numbers.
+    
+    Returns a list of (original number, filename) pairs in output order.
+    """
+    sorted_sections = sorted(sections.keys())
+    tasks = [(old_num, sections[old_num], output_dir, new_num, manifest)
+             for new_num, old_num in enumerate(sorted_sections, 1)]
+    return list(zip(sorted_sections, run_tasks(save_section_file, tasks, jobs)))
+
+def create_section_groups(sections, section_groups, output_dir, manifest=None, jobs=1):
+    """Create grouped files based on configuration with sequential numbering within groups.
+    
+    With a manifest a group file is only regenerated when its configuration
+    entry or one of its member sections changed.
+    """
+    if not section_groups:
+        return
+    
+    # Sections listed in several groups at the same position are renumbered
+    # once; files written by split_stream are read per group to bound memory
+    renderings = None
+    if not isinstance(sections, SectionFiles):
+        renderings = Renderings(Counter(
+            (old_num, new_num)
+            for group_info in section_groups.values()
+            for new_num, old_num in enumerate(group_info.get('sections', []), 1)
+            if old_num in sections
+        ))
+    tasks = [(sections, group_name, group_info, output_dir, manifest, renderings)
+             for group_name, group_info in section_groups.items()]
+    run_tasks(write_section_group, tasks, jobs)
 
 def main():
+    parser = argparse.ArgumentParser(description='Split a Markdown tutorial into individual section files.')
+    parser.add_argument('input_file', nargs='?', default='cursor_tutorial.md',
+                        help='Path to the input Markdown file (default: cursor_tutorial.md)')
+    parser.add_argument('--output-dir', default='split_tutorial',
+                        help='Directory for the section files (default: split_tutorial)')
+    parser.add_argument('--config', default='section_groups.json',
+                        help='Section grouping configuration (default: section_groups.json)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the input line by line with memory bounded by the largest section')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Skip section and group files whose content has not changed')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of threads used to write section and group files (default: 1)')
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    
+    with instrumented(args, 'split_tutorial'):
+        run(args)
+
+def run(args):
+    """Split the tutorial as configured by the parsed command line arguments."""
     # Create output directory
-    output_dir = 'split_tutorial'
+    output_dir = args.output_dir
     ensure_dir(output_dir)
     
-    # Read the original tutorial
-    with open('cursor_tutorial.md', 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # First extract all sections
-    sections = extract_sections(content)
+    # Content hashes from the previous run
+    manifest = BuildManifest.for_directory(output_dir) if args.incremental else None
     
-    # Save each section as a separate file with sequential numbering
-    sorted_sections = sorted(sections.keys())
-    for new_num, old_num in enumerate(sorted_sections, 1):
-        filename = save_section_file(old_num, sections[old_num], output_dir, new_num)
-        print(f"Created section file: {filename} (original section {old_num})")
+    if args.stream:
+        # Write each section file while reading, then build groups from the files
+        with METRICS.stage('split_stream'):
+            written = split_stream(args.input_file, output_dir, manifest)
+        sections = SectionFiles(written, output_dir, manifest)
+        sorted_sections = list(written.keys())
+    else:
+        # Read the original tutorial
+        with METRICS.stage('read'):
+            with open(args.input_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            METRICS.read(args.input_file)
+        
+        # First extract all sections
+        with METRICS.stage('extract_sections'):
+            sections = extract_sections(content)
+        
+        # Save each section as a separate file with sequential numbering
+        with METRICS.stage('save_sections'):
+            saved = save_sections(sections, output_dir, manifest, args.jobs)
+        for old_num, filename in saved:
+            print(f"Created section file: {filename} (original section {old_num})")
+        sorted_sections = [old_num for old_num, filename in saved]
     
     # Load section groups configuration if exists
-    section_groups = load_section_groups()
+    section_groups = load_section_groups(args.config)
     if section_groups:
-        create_section_groups(sections, section_groups, output_dir)
+        with METRICS.stage('create_section_groups'):
+            create_section_groups(sections, section_groups, output_dir, manifest, args.jobs)
         print("Created section group files according to configuration with renumbered sections")
     
+    if manifest is not None:
+        manifest.save()
+        print(f"Incremental build: {manifest.written} files written, {manifest.skipped} unchanged")
+    
     # Print found sections for verification
     print("Found sections:", sorted_sections)
     print("Tutorial has been successfully split into individual section files with sequential numbering!")
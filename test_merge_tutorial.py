@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from merge_tutorial import merge_sections
+from renumber_tutorial import renumber_file
+
+SECTIONS = {
+    'section_01.md': "## 1. Intro\n\nText.\n\n### 1.1 Setup\n\nText.\n",
+    'section_02.md': "## 2. Setup\n\nText.\n",
+}
+
+SECTION_GROUPS = {
+    'group': {'header': '# Group', 'sections': [1, 2]},
+}
+
+
+class SlugTocTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for name, content in SECTIONS.items():
+            with open(os.path.join(self.directory.name, name), 'w', encoding='utf-8') as f:
+                f.write(content)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def merge_and_renumber(self, stream):
+        merged_file = os.path.join(self.directory.name, 'merged.md')
+        renumbered_file = os.path.join(self.directory.name, 'renumbered.md')
+        merge_sections(self.directory.name, merged_file, SECTION_GROUPS, anchors='slug', stream=stream)
+        renumber_file(merged_file, renumbered_file, anchor_style='slug')
+        with open(merged_file, encoding='utf-8') as f:
+            merged = f.read()
+        with open(renumbered_file, encoding='utf-8') as f:
+            renumbered = f.read()
+        return merged, renumbered
+
+    def test_duplicate_title_links_to_renumbered_anchor(self):
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                merged, renumbered = self.merge_and_renumber(stream)
+                # The subsection "Setup" comes first and keeps the plain slug
+                self.assertIn('- [2. Setup](#setup-1)', merged)
+                self.assertIn('<a id="setup-1"></a>\n## 2. Setup', renumbered)
+
+
+if __name__ == '__main__':
+    unittest.main()
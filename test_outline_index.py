@@ -0,0 +1,39 @@
+import unittest
+
+from outline_index import scan_outline
+
+DOCUMENT = """# Tutorial
+
+## 1. First
+
+Intro.
+
+### 1.1 Details
+
+Text.
+
+# Group
+
+Group intro.
+
+## 2. Second
+
+Text.
+"""
+
+
+class ScanOutlineTest(unittest.TestCase):
+
+    def test_unnumbered_group_header_ends_section(self):
+        buffer = DOCUMENT.encode('utf-8')
+        rows = {row['position']: row for row in scan_outline(buffer)}
+        group = buffer.index(b'# Group')
+        self.assertEqual(rows['1']['end'], group)
+        self.assertEqual(rows['1.1']['end'], group)
+        self.assertEqual(rows['1']['body_end'], buffer.index(b'### 1.1'))
+        self.assertEqual(rows['2']['start'], buffer.index(b'## 2.'))
+        self.assertEqual(rows['2']['end'], len(buffer))
+
+
+if __name__ == '__main__':
+    unittest.main()
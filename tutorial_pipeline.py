@@ -0,0 +1,231 @@
+import os
+import re
+
+from header_lexer import HeaderLexer, is_section_header, lex_line, renumber_header
+from instrumentation import METRICS
+from merge_tutorial import Section, SectionStore, create_table_of_contents
+from renderers import render_document
+from renumber_tutorial import (ANCHOR_PATTERNS, ANCHOR_TEXTS, build_document, build_edits, clean_existing_anchors,
+                               count_outline, header_anchors, iter_document, parse_document, write_edits)
+from split_tutorial import ensure_dir, section_filename
+
+# Anchors from a previous renumbering that take up a whole line, by anchor style
+LINE_ANCHOR_PATTERNS = {style: re.compile('^' + text, re.M) for style, text in ANCHOR_TEXTS.items()}
+
+def split_sections(lines):
+    """Split source lines into Sections numbered in order of their original numbers.
+
+    Works like split_tutorial.extract_sections followed by
+    save_sections, but every line is lexed only once and the Sections keep
+    the tokens of that pass. Returns (sections by new number, balanced),
+    where balanced is False if the document ends inside a code fence.
+    """
+    ranges = {}
+    current = None
+    start = start_offset = 0
+    tokens = []
+    lexer = HeaderLexer()
+
+    for line in lines:
+        token = lexer.feed(line)
+        if token is None:
+            continue
+        if is_section_header(token):
+            if current is not None:
+                ranges[current] = (start, token.index, tokens)
+            current = token.numbers[0]
+            start = token.index
+            start_offset = token.offset
+            tokens = []
+        if current is not None:
+            # Section tokens count lines and characters from the section start
+            tokens.append(token._replace(index=token.index - start, offset=token.offset - start_offset))
+
+    if current is not None:
+        ranges[current] = (start, len(lines), tokens)
+
+    METRICS.count('lines_scanned', lexer.index)
+    METRICS.match('section', len(ranges))
+    sections = {}
+    for new_num, old_num in enumerate(sorted(ranges), 1):
+        start, end, tokens = ranges[old_num]
+        sections[new_num] = Section(new_num, lines[start:end], tokens)
+    return sections, lexer.fence is None
+
+class MergedDocument:
+    """Lines and header tokens of the merged tutorial, assembled piece by piece.
+
+    Pieces are joined with '\\n' exactly like merge_tutorial joins them.
+    Section tokens are reused with shifted indexes and offsets, and only
+    renumbered header lines are lexed again. exact turns False when a piece
+    could make lexing the whole document differ from lexing the pieces (an
+    unclosed code fence or an anchor the join would complete).
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.tokens = []
+        self.offset = 0
+        self.exact = True
+
+    def add_lines(self, lines):
+        self.lines.extend(lines)
+        self.offset += sum(map(len, lines)) + len(lines)
+        if '</a>' in lines[-1]:
+            self.exact = False
+
+    def add_text(self, text):
+        """Append a piece of text such as the TOC or a group header."""
+        lines = text.split('\n')
+        lexer = HeaderLexer()
+        for line in lines:
+            token = lexer.feed(line)
+            if token is not None:
+                self.tokens.append(token._replace(index=len(self.lines) + token.index,
+                                                  offset=self.offset + token.offset))
+        if lexer.fence is not None:
+            self.exact = False
+        self.add_lines(lines)
+
+    def add_section(self, section, new_number):
+        """Append a section renumbered as section new_number."""
+        base = len(self.lines)
+        lines = list(section.lines)
+        # Renumbered headers change length and shift later offsets in the section
+        shift = self.offset
+        for token in section.tokens:
+            new_line = renumber_header(token, new_number)
+            if new_line is None:
+                self.tokens.append(token._replace(index=base + token.index, offset=shift + token.offset))
+                continue
+            lines[token.index] = new_line
+            self.tokens.append(lex_line(new_line, base + token.index, shift + token.offset))
+            shift += len(new_line) - len(token.line)
+        if not section.balanced:
+            self.exact = False
+        self.add_lines(lines)
+
+    def add_document(self, piece):
+        """Append the lines and tokens of another MergedDocument, such as a cached group."""
+        base = len(self.lines)
+        self.tokens.extend(token._replace(index=base + token.index, offset=self.offset + token.offset)
+                           for token in piece.tokens)
+        if not piece.exact:
+            self.exact = False
+        self.add_lines(piece.lines)
+
+    def add_group(self, group_info, store, first_number, anchor_style=None):
+        """Append a group like merge_tutorial.write_group and return the number of its next section.
+
+        With anchor_style, old anchors in the group header are removed.
+        """
+        header = f"\n\n{group_info['header']}"
+        if anchor_style is not None and self.exact:
+            header = clean_existing_anchors(header, anchor_style)
+        self.add_text(header)
+        current_section = first_number
+        for section_num in group_info.get('sections', []):
+            section = store.get(section_num)
+            if section and section.lines != ['']:
+                self.add_section(section, current_section)
+                current_section += 1
+        self.add_text("\n---\n")
+        return current_section
+
+    def document(self, anchor_style='number'):
+        """Return the parse_document model of the merged lines, parsing them again only if not exact."""
+        if self.exact:
+            return build_document(self.lines, self.tokens)
+        return parse_document('\n'.join(self.lines), anchor_style)
+
+def merge_document(content, section_groups, anchor_style='number'):
+    """Split, merge and parse a tutorial in memory.
+
+    Returns (doc_info, sections): the parse_document model of the merged
+    tutorial, ready for build_edits, and the split sections by number. The
+    result is the same as running split_tutorial, merge_tutorial and
+    renumber_tutorial's parse one after another; anchor_style picks the
+    old anchors to remove as in renumber_tutorial.parse_document.
+    """
+    # Old anchors go first so the merged lines need no cleaning; an anchor
+    # that does not take up a whole line falls back to cleaning the merged text
+    with METRICS.stage('split'):
+        cleaned, removed = LINE_ANCHOR_PATTERNS[anchor_style].subn('', content)
+        exact = ANCHOR_PATTERNS[anchor_style].search(cleaned) is None
+        METRICS.match('anchor', removed if exact else 0)
+        sections, balanced = split_sections((cleaned if exact else content).split('\n'))
+
+    with METRICS.stage('merge'):
+        store = SectionStore(None)
+        for section_num, section in sections.items():
+            store.put(section_num, section)
+        for group_info in section_groups.values():
+            for section_num in group_info.get('sections', []):
+                if section_num not in store.sections:
+                    print(f"Warning: Section {section_num} not found")
+                    store.put(section_num, None)
+
+        merged = MergedDocument()
+        merged.exact = exact and balanced
+        merged.add_text(create_table_of_contents(section_groups, None, store))
+        current_section = 1
+        for group_info in section_groups.values():
+            current_section = merged.add_group(group_info, store, current_section, anchor_style)
+
+    with METRICS.stage('parse'):
+        doc_info = merged.document(anchor_style)
+    return doc_info, sections
+
+def write_debug_files(debug_dir, sections, doc_info):
+    """Write the intermediate section files and merged tutorial for inspection."""
+    ensure_dir(debug_dir)
+    for section_num, section in sections.items():
+        with open(os.path.join(debug_dir, section_filename(section_num)), 'w', encoding='utf-8') as f:
+            f.write(section.renumbered(section_num))
+    with open(os.path.join(debug_dir, 'merged.md'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(doc_info['lines']))
+
+def write_renumbered(doc_info, output_file, max_depth=None, formats=None, anchor_style='number'):
+    """Write the renumbered document in each of formats (Markdown only by default) and return the paths written."""
+    anchors = header_anchors(doc_info['sections'], max_depth, anchor_style)
+    with METRICS.stage('renumber'):
+        if formats and list(formats) != ['markdown']:
+            return render_document(iter_document(doc_info, max_depth, anchors=anchors), output_file, formats, anchors)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            write_edits(doc_info['lines'], build_edits(doc_info, max_depth, anchors=anchors), f)
+        METRICS.wrote(output_file)
+    return [output_file]
+
+def build_tutorial_file(source_file, section_groups, output_file, debug_dir=None, max_depth=None, formats=None,
+                        anchor_style='number'):
+    """Build the renumbered merged tutorial from source_file in one pass.
+
+    Only output_file is written, plus the intermediate files in debug_dir
+    if one is given. Headers deeper than max_depth are not renumbered.
+    formats lists the outputs to render from the merged model (Markdown
+    only by default) and anchor_style the anchors, as in renumber_tutorial.
+    Returns a summary dict like renumber_tutorial.renumber_file.
+    """
+    with METRICS.stage('read'):
+        with open(source_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+    METRICS.read(source_file)
+
+    doc_info, sections = merge_document(content, section_groups, anchor_style)
+    outputs = write_renumbered(doc_info, output_file, max_depth, formats, anchor_style)
+
+    if debug_dir:
+        write_debug_files(debug_dir, sections, doc_info)
+
+    section_count, subsection_count, subsubsection_count, deeper_count = count_outline(doc_info['sections'])
+    return {
+        'input': source_file,
+        'output': output_file,
+        'outputs': outputs,
+        'sections': section_count,
+        'subsections': subsection_count,
+        'subsubsections': subsubsection_count,
+        'deeper': deeper_count,
+        'bytes': len(content.encode('utf-8')),
+        'debug': doc_info['debug']
+    }